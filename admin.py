@@ -1,26 +1,86 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, abort, current_app, Response
 from flask_login import login_required
+from collections import Counter, namedtuple
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from models import db, ParkingLot, ParkingSpot, User, Reservation
+from sqlalchemy import func, case, select
+from sqlalchemy.orm import defer
+from models import db, ParkingLot, ParkingSpot, User, Reservation, ArchivedReservation, EmailJob, WaitlistEntry, ProfileReport
+from archive import get_archived_revenue
+from analytics import get_daily_occupancy, summarize_occupancy
+from catalog import get_lot_catalog, get_catalog_version, spot_grid_catalog
+from readmodels import get_recent_booking_rows
+from purge import start_purge_worker
+from user import cancel_before_delete
+from profiling import get_profile_report, flatten_call_tree
+from sharding import fan_out, fan_out_lots, session_for_lot, session_for_id, shard_for_pin, mirror_lot, remove_lot_mirror
 from utils import admin_required
+from cache import TTLCache
+from config import Config
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+# Rendered spot grid HTML keyed by (lot id, that lot's spot version in catalog_version).
+# Any worker's write to the lot's spots bumps the version, so a stale grid is never
+# served; the TTL only clears out grids for versions that have moved on.
+spot_grid_cache = TTLCache(ttl=Config.SPOT_GRID_CACHE_TTL)
+
+LotSummary = namedtuple('LotSummary', ['id', 'prime_location_name', 'total', 'occupied'])
+
 
 # ----------------------------
-# Dashboard Stats Helper
+# Dashboard Stats Helpers
 # ----------------------------
-def get_dashboard_stats():
-    parking_lots = ParkingLot.query.all()
-    users = User.query.all()
-    reservations = Reservation.query.all()
-    total_spots = sum(len(lot.spots) for lot in parking_lots)
-    occupied_spots = sum(
-        1 for lot in parking_lots for spot in lot.spots if spot.status != 'A'
+def get_header_stats():
+    """Header card figures computed in the database instead of loading every row.
+
+    Spot and revenue totals are summed over every shard, queried in parallel.
+    """
+    totals = fan_out(_shard_header_totals)
+    return {
+        'lot_count': db.session.query(func.count(ParkingLot.id)).filter(ParkingLot.deleted_at.is_(None)).scalar(),
+        'user_count': db.session.query(func.count(User.id)).filter(User.deleted_at.is_(None)).scalar(),
+        'total_spots': sum(spots for spots, _, _ in totals),
+        'occupied_spots': sum(occupied for _, occupied, _ in totals),
+        'total_revenue': sum(revenue for _, _, revenue in totals),
+    }
+
+
+def _shard_header_totals(session):
+    total_spots, occupied_spots = session.query(
+        func.count(ParkingSpot.id),
+        func.coalesce(func.sum(case((ParkingSpot.status != 'A', 1), else_=0)), 0)
+    ).join(ParkingLot, ParkingLot.id == ParkingSpot.lot_id).filter(ParkingLot.deleted_at.is_(None)).one()
+    revenue = session.query(
+        func.coalesce(func.sum(Reservation.parking_cost), 0)
+    ).scalar() + get_archived_revenue(session)
+    return total_spots, occupied_spots, revenue
+
+
+def get_lot_summaries():
+    """Return (id, name, total, occupied) per lot, one grouped query per shard."""
+    lots = (
+        db.session.query(ParkingLot.id, ParkingLot.prime_location_name)
+        .filter(ParkingLot.deleted_at.is_(None))
+        .order_by(ParkingLot.id)
+        .all()
+    )
+    counts = {}
+    for rows in fan_out_lots(_count_lot_spots, [lot.id for lot in lots]):
+        counts.update((lot_id, (total, occupied)) for lot_id, total, occupied in rows)
+    return [LotSummary(lot.id, lot.prime_location_name, *counts.get(lot.id, (0, 0))) for lot in lots]
+
+
+def _count_lot_spots(session, lot_ids):
+    return (
+        session.query(
+            ParkingSpot.lot_id,
+            func.count(ParkingSpot.id),
+            func.coalesce(func.sum(case((ParkingSpot.status != 'A', 1), else_=0)), 0)
+        )
+        .filter(ParkingSpot.lot_id.in_(lot_ids))
+        .group_by(ParkingSpot.lot_id)
+        .all()
     )
-    total_revenue = sum(r.parking_cost or 0 for r in reservations)
-    return parking_lots, users, reservations, total_spots, occupied_spots, total_revenue
 
 
 # ----------------------------
@@ -29,18 +89,17 @@ def get_dashboard_stats():
 @admin_bp.route('/dashboard')
 @admin_required
 def admin_dashboard():
-    parking_lots, users, reservations, total_spots, occupied_spots, total_revenue = get_dashboard_stats()
+    available_by_lot = {row.id: row.total - row.occupied for row in get_lot_summaries()}
 
     recent_items = []
-    bookings = Reservation.query.order_by(Reservation.parking_timestamp.desc()).limit(5).all()
-    for b in bookings:
+    for b in get_recent_booking_rows():
         recent_items.append({
             "icon": "🅿️",
-            "message": f"New booking at {b.lot.prime_location_name}",
+            "message": f"New booking at {b.lot_name}",
             "timestamp": b.parking_timestamp
         })
 
-    users_recent = User.query.order_by(User.id.desc()).limit(5).all()
+    users_recent = User.query.filter(User.deleted_at.is_(None)).order_by(User.id.desc()).limit(5).all()
     for u in users_recent:
         recent_items.append({
             "icon": "👤",
@@ -54,11 +113,9 @@ def admin_dashboard():
         'admin/admin_dashboard.html',
         recent_activities=recent_items,
         current_page='dashboard',
-        parking_lots=parking_lots,
-        users=users,
-        total_revenue=total_revenue,
-        total_spots=total_spots,
-        occupied_spots=occupied_spots
+        parking_lots=get_lot_catalog(),
+        available_by_lot=available_by_lot,
+        **get_header_stats()
     )
 
 
@@ -92,6 +149,7 @@ def add_lot():
         )
         db.session.add(lot)
         db.session.commit()
+        mirror_lot(lot)
 
         flash("✅ Parking lot added successfully!", "success")
 
@@ -122,6 +180,10 @@ def edit_lot(lot_id):
         if not name or not address or not pin_code:
             flash("⚠️ Missing required fields (Name, Address, or Pin Code).", "danger")
             return redirect(url_for("admin.admin_dashboard"))
+        if shard_for_pin(pin_code) != shard_for_pin(lot.pin_code):
+            # Spots and bookings are not moved between regional databases
+            flash("⚠️ That pin code belongs to another region; add a new lot there instead.", "danger")
+            return redirect(url_for("admin.admin_dashboard"))
 
         lot.prime_location_name = name
         lot.address = address
@@ -131,6 +193,7 @@ def edit_lot(lot_id):
         lot.longitude = float(longitude) if longitude else None
 
         db.session.commit()
+        mirror_lot(lot)
         flash("✅ Lot updated successfully!", "success")
 
     except Exception as e:
@@ -146,48 +209,71 @@ def edit_lot(lot_id):
 @admin_bp.route('/parking_spots')
 @admin_required
 def parking_spots_overview():
-    parking_lots, users, reservations, total_spots, occupied_spots, total_revenue = get_dashboard_stats()
+    # Only lot summaries are rendered here; each grid is fetched from parking_spot_grid
     return render_template(
         'admin/admin_parking_spots.html',
         current_page='spots',
-        parking_lots=parking_lots,
-        users=users,
-        total_revenue=total_revenue,
-        total_spots=total_spots,
-        occupied_spots=occupied_spots
+        lot_summaries=get_lot_summaries(),
+        **get_header_stats()
     )
 
 
+@admin_bp.route('/parking_spots/<int:lot_id>/grid')
+@admin_required
+def parking_spot_grid(lot_id):
+    # Read before the spots, so a write landing in between only makes this copy look older
+    key = (lot_id, get_catalog_version(spot_grid_catalog(lot_id)))
+    html = spot_grid_cache.get(key)
+    if html is None:
+        spots = (
+            session_for_lot(lot_id).query(ParkingSpot.number, ParkingSpot.status)
+            .filter(ParkingSpot.lot_id == lot_id)
+            .order_by(ParkingSpot.number)
+            .all()
+        )
+        html = render_template('admin/admin_spot_grid.html', spots=spots)
+        spot_grid_cache.set(key, html)
+    return html
+
+
 # ----------------------------
 # Users Management
 # ----------------------------
 @admin_bp.route('/users')
 @admin_required
 def admin_users():
-    parking_lots, users, reservations, total_spots, occupied_spots, total_revenue = get_dashboard_stats()
+    users = User.query.filter(User.deleted_at.is_(None)).all()
+    booking_counts = Counter()
+    for counts in fan_out(_count_bookings_by_user):
+        booking_counts.update(counts)
     for user in users:
-        user.total_bookings = Reservation.query.filter_by(user_id=user.id).count()
+        user.total_bookings = booking_counts[user.id]
     return render_template(
         'admin/admin_users.html',
         current_page='users',
-        parking_lots=parking_lots,
         users=users,
-        total_revenue=total_revenue,
-        total_spots=total_spots,
-        occupied_spots=occupied_spots
+        **get_header_stats()
     )
 
 
+def _count_bookings_by_user(session):
+    return dict(session.query(Reservation.user_id, func.count(Reservation.id)).group_by(Reservation.user_id).all())
+
+
 # ----------------------------
 # Delete Spot
 # ----------------------------
 @admin_bp.route('/delete_spot/<int:spot_id>', methods=['POST'])
 @admin_required
 def delete_parking_spot(spot_id):
-    spot = ParkingSpot.query.get_or_404(spot_id)
-    db.session.delete(spot)
-    db.session.commit()
-    flash(f'Spot #{spot.id} deleted.', 'success')
+    session = session_for_id(spot_id)
+    spot = session.get(ParkingSpot, spot_id) or abort(404)
+    # Live bookings are cancelled first; then all of them go with the spot through ON DELETE CASCADE
+    reservation_ids = session.execute(select(Reservation.id).filter_by(spot_id=spot_id)).scalars().all()
+    cancel_before_delete(session, reservation_ids, datetime.now())
+    session.delete(spot)
+    session.commit()
+    flash(f'Spot #{spot.number} deleted.', 'success')
     return redirect(request.referrer or url_for('admin.admin_dashboard'))
 
 
@@ -199,14 +285,17 @@ def delete_parking_spot(spot_id):
 def add_spots(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
     number_of_spots = int(request.form['number_of_spots'])
-    current_spot_count = ParkingSpot.query.filter_by(lot_id=lot_id).count()
+    session = session_for_lot(lot_id)
+    current_spot_count = session.query(ParkingSpot).filter_by(lot_id=lot_id).count()
     if current_spot_count + number_of_spots > lot.maximum_number_of_spots:
         flash("Cannot exceed maximum number of spots!", "danger")
         return redirect(url_for('admin.admin_dashboard'))
-    for _ in range(number_of_spots):
-        spot = ParkingSpot(lot_id=lot.id)
-        db.session.add(spot)
-    db.session.commit()
+    # Numbers carry on after the lot's highest, so deleted spots never hand theirs to a new one
+    last_number = session.query(func.max(ParkingSpot.number)).filter_by(lot_id=lot_id).scalar() or 0
+    for number in range(last_number + 1, last_number + number_of_spots + 1):
+        spot = ParkingSpot(lot_id=lot.id, number=number)
+        session.add(spot)
+    session.commit()
     flash(f"{number_of_spots} spots added to {lot.prime_location_name}", "success")
     return redirect(url_for('admin.admin_dashboard'))
 
@@ -218,49 +307,93 @@ def add_spots(lot_id):
 @admin_required
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
+    if user.deleted_at:
+        abort(404)
+    if current_app.config['SOFT_DELETE']:
+        # Hide now; bookings are removed in batches by the purge worker
+        user.deleted_at = datetime.utcnow()
+        _close_waitlist(WaitlistEntry.user_id == user_id)
+        db.session.commit()
+        start_purge_worker(current_app._get_current_object())
+    else:
+        # Bookings in regional shards have no foreign key to cascade along
+        fan_out(lambda session: _delete_user_bookings(session, user_id))
+        if user.email:
+            EmailJob.query.filter_by(recipient=user.email).delete(synchronize_session=False)
+        db.session.delete(user)
+        db.session.commit()
     flash('User deleted successfully!', 'success')
     return redirect(url_for('admin.admin_users'))
 
 
+def _close_waitlist(condition):
+    # Soft-deleted rows stay until purged; their queue entries must not be served meanwhile
+    WaitlistEntry.query.filter(condition, WaitlistEntry.status.in_(('waiting', 'offered')))\
+        .update({WaitlistEntry.status: 'expired'}, synchronize_session=False)
+
+
+def _delete_user_bookings(session, user_id):
+    for model in (Reservation, ArchivedReservation):
+        session.query(model).filter(model.user_id == user_id).delete(synchronize_session=False)
+    session.commit()
+
+
+# ----------------------------
+# Delete Parking Lot
+# ----------------------------
+@admin_bp.route('/lot/<int:lot_id>/delete', methods=['POST'])
+@admin_required
+def delete_lot(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    if lot.deleted_at:
+        abort(404)
+    if current_app.config['SOFT_DELETE']:
+        # Hide now; spots and bookings are removed in batches by the purge worker
+        lot.deleted_at = datetime.utcnow()
+        _close_waitlist(WaitlistEntry.lot_id == lot_id)
+        db.session.commit()
+        mirror_lot(lot)
+        start_purge_worker(current_app._get_current_object())
+    else:
+        remove_lot_mirror(lot)
+        db.session.delete(lot)
+        db.session.commit()
+    flash(f"Parking lot {lot.prime_location_name} deleted.", "success")
+    return redirect(url_for('admin.admin_dashboard'))
+
+
 # ----------------------------
 # Admin Summary
 # ----------------------------
 @admin_bp.route('/summary')
 @admin_required
 def admin_summary():
-    parking_lots, users, reservations, total_spots, occupied_spots, total_revenue = get_dashboard_stats()
-
-    lots = ParkingLot.query.all()
-    total_available = ParkingSpot.query.filter_by(status='A').count()
-    total_occupied = ParkingSpot.query.filter_by(status='O').count()
+    lots = get_lot_catalog()
     lot_names = [lot.prime_location_name for lot in lots]
-    spot_counts = [len(lot.spots) for lot in lots]
+    spot_counts = [lot.spot_count for lot in lots]
 
     today = datetime.utcnow().date()
     start_date = today - timedelta(days=6)
-    income_data = (
-        db.session.query(
-            func.date(Reservation.parking_timestamp).label('date'),
-            func.sum(Reservation.parking_cost).label('total_income')
-        )
-        .filter(Reservation.parking_timestamp >= start_date)
-        .group_by(func.date(Reservation.parking_timestamp))
-        .all()
-    )
-    income_by_date = {str(row.date): float(row.total_income or 0) for row in income_data}
+    # Every shard answers for its own lots in parallel; the figures are summed here
+    total_available = total_occupied = 0
+    income_by_date = Counter()
+    bookings_by_user = Counter()
+    for available, occupied, income, bookings in fan_out(lambda session: _shard_summary(session, start_date)):
+        total_available += available
+        total_occupied += occupied
+        income_by_date.update(income)
+        bookings_by_user.update(bookings)
     dates = [(start_date + timedelta(days=i)).isoformat() for i in range(7)]
     income_values = [income_by_date.get(date, 0) for date in dates]
 
     user_data = (
-        db.session.query(User.username, func.count(Reservation.id))
-        .join(Reservation)
-        .group_by(User.id)
+        db.session.query(User.id, User.username)
+        .filter(User.id.in_(list(bookings_by_user)), User.deleted_at.is_(None))
+        .order_by(User.id)
         .all()
-    )
-    user_names = [u[0] for u in user_data]
-    user_bookings = [u[1] for u in user_data]
+    ) if bookings_by_user else []
+    user_names = [u.username for u in user_data]
+    user_bookings = [bookings_by_user[u.id] for u in user_data]
 
     return render_template(
         'admin/admin_summary.html',
@@ -273,9 +406,109 @@ def admin_summary():
         income_values=income_values,
         user_names=user_names,
         user_bookings=user_bookings,
-        parking_lots=parking_lots,
-        users=users,
-        total_revenue=total_revenue,
-        total_spots=total_spots,
-        occupied_spots=occupied_spots
+        **get_header_stats()
+    )
+
+
+def _shard_summary(session, start_date):
+    live_spots = session.query(ParkingSpot).join(ParkingLot).filter(ParkingLot.deleted_at.is_(None))
+    available = live_spots.filter(ParkingSpot.status == 'A').count()
+    occupied = live_spots.filter(ParkingSpot.status == 'O').count()
+    income_data = (
+        session.query(
+            func.date(Reservation.parking_timestamp).label('date'),
+            func.sum(Reservation.parking_cost).label('total_income')
+        )
+        .filter(Reservation.parking_timestamp >= start_date)
+        .group_by(func.date(Reservation.parking_timestamp))
+        .all()
+    )
+    income = {str(row.date): float(row.total_income or 0) for row in income_data}
+    return available, occupied, income, _count_bookings_by_user(session)
+
+
+# ----------------------------
+# Hourly Occupancy Analytics
+# ----------------------------
+@admin_bp.route('/occupancy')
+@admin_required
+def occupancy_analytics():
+    today = datetime.now().date()
+    try:
+        end_day = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else today
+        start_day = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args \
+            else end_day - timedelta(days=6)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD.'}), 400
+    if start_day > end_day or (end_day - start_day).days > 92:
+        return jsonify({'error': 'Range must be between 1 and 93 days.'}), 400
+
+    daily = get_daily_occupancy(start_day, end_day)
+    profile, peak = summarize_occupancy(daily)
+    lots = get_lot_summaries()
+
+    return jsonify({
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'lots': [
+            {
+                'id': lot.id,
+                'name': lot.prime_location_name,
+                'total_spots': lot.total,
+                'hourly_peak': profile.get(lot.id, [0] * 24),
+                'peak_count': peak[lot.id][0] if lot.id in peak else 0,
+                'peak_at': peak[lot.id][1].isoformat() if lot.id in peak else None,
+                'daily': {
+                    day.isoformat(): grid[lot.id]
+                    for day, grid in sorted(daily.items()) if lot.id in grid
+                }
+            }
+            for lot in lots
+        ]
+    })
+
+
+# ----------------------------
+# Request Profiles
+# ----------------------------
+@admin_bp.route('/profiles')
+@admin_required
+def profile_reports():
+    reports = ProfileReport.query.options(defer(ProfileReport.report))\
+        .order_by(ProfileReport.id.desc()).all()
+    return render_template(
+        'admin/admin_profiles.html',
+        current_page='profiles',
+        reports=reports,
+        **get_header_stats()
+    )
+
+
+@admin_bp.route('/profiles/<int:report_id>')
+@admin_required
+def profile_report(report_id):
+    row, report = get_profile_report(report_id)
+    if row is None:
+        abort(404)
+    return render_template(
+        'admin/admin_profile.html',
+        current_page='profiles',
+        row=row,
+        report=report,
+        tree_rows=flatten_call_tree(report['call_tree']),
+        **get_header_stats()
+    )
+
+
+@admin_bp.route('/profiles/<int:report_id>/collapsed.txt')
+@admin_required
+def profile_collapsed_stacks(report_id):
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    row, report = get_profile_report(report_id)
+    if row is None:
+        abort(404)
+    return Response(
+        report['collapsed'] + '\n',
+        mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename=profile-{report_id}.collapsed.txt'}
     )
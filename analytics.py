@@ -0,0 +1,118 @@
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import select, union_all
+from models import ParkingSpot, Reservation, ArchivedReservation
+from sharding import shard_keys, shard_session
+from cache import TTLCache
+from config import Config
+
+# Per-day occupancy grids, only stored once the day has ended
+_closed_day_cache = TTLCache(ttl=Config.OCCUPANCY_CACHE_TTL)
+
+
+def _intervals(range_start, range_end):
+    """Stream (lot_id, start, end) for live and archived bookings overlapping the range.
+
+    Cancelled bookings count for the time the car was actually there, up to
+    their leaving_timestamp; one cancelled before it started has no length
+    and is skipped. Each shard is streamed in turn; the sweep sorts all
+    events anyway.
+    """
+    queries = [
+        select(ParkingSpot.lot_id, model.parking_timestamp, model.leaving_timestamp)
+        .join(ParkingSpot, ParkingSpot.id == model.spot_id)
+        .where(
+            model.parking_timestamp < range_end,
+            model.leaving_timestamp > range_start,
+            model.leaving_timestamp > model.parking_timestamp
+        )
+        for model in (Reservation, ArchivedReservation)
+    ]
+    statement = union_all(*queries).execution_options(yield_per=1000)
+    for key in shard_keys():
+        for lot_id, start, end in shard_session(key).execute(statement):
+            yield lot_id, start, end
+
+
+def sweep_hourly_occupancy(range_start, range_end):
+    """Peak concurrent bookings per lot for each hour in [range_start, range_end).
+
+    All start/end events are sorted once and walked in a single pass. Returns
+    {lot_id: [peak for hour 0, hour 1, ...]} covering every hour of the range.
+    """
+    hours = int((range_end - range_start).total_seconds() // 3600)
+    # Net change per (instant, lot): back-to-back bookings cancel out instead of overlapping
+    events = defaultdict(int)
+    for lot_id, start, end in _intervals(range_start, range_end):
+        events[(max(start, range_start), lot_id)] += 1
+        events[(min(end, range_end), lot_id)] -= 1
+
+    peaks = {}
+    current = {}
+    last_hour = {}
+    for (moment, lot_id), delta in sorted(events.items()):
+        offset = (moment - range_start).total_seconds()
+        hour = int(offset // 3600)
+        # An interval ending exactly on the hour does not reach into that hour
+        held_until = hour if offset % 3600 else hour - 1
+        grid = peaks.setdefault(lot_id, [0] * hours)
+        count = current.get(lot_id, 0)
+        # The running count held for every hour since this lot's previous event
+        if count:
+            for h in range(last_hour.get(lot_id, hour), min(held_until + 1, hours)):
+                grid[h] = max(grid[h], count)
+        count += delta
+        current[lot_id] = count
+        last_hour[lot_id] = hour
+        if hour < hours:
+            grid[hour] = max(grid[hour], count)
+    return peaks
+
+
+def get_daily_occupancy(start_day, end_day):
+    """Return {day: {lot_id: [24 hourly peaks]}} for each day in [start_day, end_day].
+
+    Closed days come from the cache when possible; the remaining days are
+    computed together in one sweep over a contiguous range.
+    """
+    today = date.today()
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    result = {}
+    missing = []
+    for day in days:
+        cached = _closed_day_cache.get(day) if day < today else None
+        if cached is None:
+            missing.append(day)
+        else:
+            result[day] = cached
+
+    if missing:
+        range_start = datetime.combine(missing[0], datetime.min.time())
+        range_end = datetime.combine(missing[-1] + timedelta(days=1), datetime.min.time())
+        peaks = sweep_hourly_occupancy(range_start, range_end)
+        for day in missing:
+            offset = (day - missing[0]).days * 24
+            day_grid = {
+                lot_id: grid[offset:offset + 24]
+                for lot_id, grid in peaks.items()
+                if any(grid[offset:offset + 24])
+            }
+            result[day] = day_grid
+            if day < today:
+                _closed_day_cache.set(day, day_grid)
+    return result
+
+
+def summarize_occupancy(daily):
+    """Collapse daily grids into an hour-of-day profile and the peak time per lot."""
+    profile = {}
+    peak = {}
+    for day in sorted(daily):
+        for lot_id, grid in daily[day].items():
+            lot_profile = profile.setdefault(lot_id, [0] * 24)
+            for hour, count in enumerate(grid):
+                lot_profile[hour] = max(lot_profile[hour], count)
+                if count > peak.get(lot_id, (0, None))[0]:
+                    peak[lot_id] = (count, datetime.combine(day, datetime.min.time()) + timedelta(hours=hour))
+    return profile, peak
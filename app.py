@@ -6,6 +6,15 @@ from models import db, User
 from admin import admin_bp
 from auth import auth_bp
 from user import user_bp
+from assets import init_assets
+from archive import init_archive
+from events import init_events
+from userstats import init_user_stats
+from purge import init_purge
+from sharding import init_sharding
+from notifications import init_notifications
+from waitlist import init_waitlist
+from profiling import init_profiling
 from datetime import datetime, timedelta
 
 def create_app():
@@ -14,6 +23,15 @@ def create_app():
 
     db.init_app(app)
     migrate = Migrate(app, db) 
+    init_sharding(app)
+    init_profiling(app)
+    init_assets(app)
+    init_archive(app)
+    init_events(app)
+    init_user_stats(app)
+    init_purge(app)
+    init_notifications(app)
+    init_waitlist(app)
 
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
@@ -21,7 +39,8 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        user = db.session.get(User, int(user_id))
+        return user if user and not user.deleted_at else None
 
     @app.context_processor
     def inject_datetime():
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import insert, delete, select, literal
+from models import db, Reservation, ArchivedReservation, LIVE_STATUSES
+from sharding import shard_keys, shard_session
+
+ARCHIVED_COLUMNS = (
+    'id', 'spot_id', 'user_id', 'parking_timestamp', 'leaving_timestamp',
+    'parking_cost', 'rating', 'feedback', 'status',
+)
+
+
+def archive_closed_reservations(before, batch_size=1000):
+    """Move reservations that ended before `before` into archived_reservation.
+
+    Each batch is copied and deleted in its own transaction so the hot table
+    is never locked for the whole run. Every shard archives into its own
+    archived_reservation table. Returns the number of rows moved.
+    """
+    archived_at = datetime.utcnow()
+    return sum(
+        _archive_shard(shard_session(key), before, batch_size, archived_at)
+        for key in shard_keys()
+    )
+
+
+def _archive_shard(session, before, batch_size, archived_at):
+    moved = 0
+    while True:
+        ids = [
+            row.id for row in session.query(Reservation.id)
+            .filter(Reservation.leaving_timestamp < before, Reservation.status.notin_(LIVE_STATUSES))
+            .order_by(Reservation.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+
+        source = select(
+            *(getattr(Reservation, name) for name in ARCHIVED_COLUMNS),
+            literal(archived_at)
+        ).where(Reservation.id.in_(ids))
+        session.execute(
+            insert(ArchivedReservation).from_select(ARCHIVED_COLUMNS + ('archived_at',), source)
+        )
+        session.execute(delete(Reservation).where(Reservation.id.in_(ids)))
+        session.commit()
+        moved += len(ids)
+    return moved
+
+
+# ----------------------------
+# Totals spanning the archive
+# ----------------------------
+def get_archived_revenue(session=None):
+    return (session or db.session).query(db.func.coalesce(db.func.sum(ArchivedReservation.parking_cost), 0)).scalar()
+
+
+def init_archive(app):
+    @app.cli.command('archive-reservations')
+    @click.option('--days', type=int, default=None, help='Archive bookings that ended more than this many days ago.')
+    @click.option('--batch-size', type=int, default=None, help='Rows moved per transaction.')
+    def archive_reservations_command(days, batch_size):
+        """Move closed reservations older than the horizon to the archive table."""
+        days = days if days is not None else app.config['RESERVATION_ARCHIVE_DAYS']
+        batch_size = batch_size or app.config['RESERVATION_ARCHIVE_BATCH_SIZE']
+        before = datetime.now() - timedelta(days=days)
+        moved = archive_closed_reservations(before, batch_size)
+        click.echo(f"Archived {moved} reservations that ended before {before:%Y-%m-%d %H:%M}")
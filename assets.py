@@ -0,0 +1,111 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip variants are always built
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.html', '.txt')
+ONE_YEAR = 365 * 24 * 3600
+
+
+def _fingerprint(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def build_assets(static_folder):
+    """Copy static files to build/ under content-hashed names with .gz/.br variants.
+
+    Returns the manifest mapping each original filename to its hashed name.
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root).startswith(os.path.abspath(build_root)):
+            continue
+        for name in files:
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{BUILD_DIR}/{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(static_folder, *hashed.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            with open(target, 'wb') as f:
+                f.write(data)
+            if ext in COMPRESSIBLE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[logical] = hashed
+
+    with open(os.path.join(build_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app):
+    """Route url_for('static') to fingerprinted files and serve them precompressed."""
+    static_folder = app.static_folder
+    app.extensions['asset_manifest'] = load_manifest(static_folder)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            manifest = app.extensions['asset_manifest']
+            values['filename'] = manifest.get(values['filename'], values['filename'])
+
+    def serve_static(filename):
+        if not filename.startswith(BUILD_DIR + '/'):
+            return app.send_static_file(filename)
+
+        # Hashed names never change content, so they can be cached forever
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            variant = os.path.join(static_folder, *(filename + suffix).split('/'))
+            if accepted[encoding] and os.path.isfile(variant):
+                response = send_from_directory(
+                    static_folder, filename + suffix, mimetype=mimetype, max_age=ONE_YEAR
+                )
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static_folder, filename, mimetype=mimetype, max_age=ONE_YEAR)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = serve_static
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and precompress everything under static/."""
+        manifest = build_assets(static_folder)
+        app.extensions['asset_manifest'] = manifest
+        click.echo(f"Built {len(manifest)} assets into {BUILD_DIR}/")
@@ -3,6 +3,7 @@ from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import User, db 
 from config import Config
+from events import log_event
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -14,9 +15,11 @@ def admin_login():
         password = request.form['password']  # Get password from form
         if username == Config.ADMIN_USERNAME and password == Config.ADMIN_PASSWORD:  # checking the credentials is correct that set in config.py
             session['is_admin_logged_in'] = True # initialized the session to true
+            log_event('login', role='admin', username=username)
             flash("Welcome, admin!", "success")
             return redirect(url_for('admin.admin_dashboard'))
         else:
+            log_event('login_failed', role='admin', username=username)
             flash("Invalid credentials", "danger")
     return render_template("auth/admin_login.html")
 
@@ -26,11 +29,13 @@ def login():
     if request.method == 'POST':
         username = request.form['username']  # Get Username from form
         password = request.form['password']  # Get Password from form
-        user = User.query.filter_by(username=username).first()  # Searching the user in database
+        user = User.query.filter_by(username=username, deleted_at=None).first()  # Searching the user in database
         if user and check_password_hash(user.password, password):   
             login_user(user)
+            log_event('login', role='user', user_id=user.id)
             flash("Login successful", "success")
             return redirect(url_for('user.user_dashboard'))
+        log_event('login_failed', role='user', username=username)
         flash("Invalid credentials", "danger")
     return render_template('auth/login.html')
 
@@ -44,7 +49,8 @@ def register():
         if existing_user:
             flash("Username already exists", "danger")
             return redirect(url_for('auth.register'))
-        user = User(username=username, password=password)  # Geting the entered credentials by user 
+        email = request.form.get('email', '').strip() or None  # Optional, for booking emails
+        user = User(username=username, password=password, email=email)  # Geting the entered credentials by user 
         db.session.add(user) 
         db.session.commit()  # Commiting the credentials 
         flash("Registration successful. Please login.", "success")
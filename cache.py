@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry expiry.
+
+    Each gunicorn worker holds its own copy, so entries are also given a
+    time-to-live to bound how long another worker's writes can go unseen.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def prune(self):
+        """Drop every expired entry; get() only drops the ones it is asked for."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._entries.items() if expires_at < now]:
+                del self._entries[key]
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
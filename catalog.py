@@ -0,0 +1,124 @@
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, func, update, insert
+from sqlalchemy.orm import Session
+from models import db, ParkingLot, ParkingSpot, CatalogVersion
+from sharding import fan_out
+
+LOT_CATALOG = 'lots'
+
+# Immutable snapshot of a lot; field names match ParkingLot so templates accept either
+LotRecord = namedtuple('LotRecord', [
+    'id', 'prime_location_name', 'address', 'pin_code', 'price',
+    'latitude', 'longitude', 'maximum_number_of_spots', 'spot_count',
+])
+
+_lock = threading.Lock()
+_cached_version = None
+_cached_lots = ()
+
+
+def get_catalog_version(name=LOT_CATALOG):
+    return db.session.query(CatalogVersion.version).filter_by(name=name).scalar() or 0
+
+
+def spot_grid_catalog(lot_id):
+    """Version name for one lot's spots, bumped whenever a spot there is added, removed or changes status."""
+    return f'spots:{lot_id}'
+
+
+def bump_catalog_version(name):
+    """Bump a version by hand, for writes made outside the ORM session listeners below."""
+    with db.engine.begin() as connection:
+        _bump(connection, name)
+
+
+def get_lot_catalog():
+    """Return all lots as a tuple of LotRecord, reloading only when the version moved."""
+    global _cached_version, _cached_lots
+    version = get_catalog_version()
+    with _lock:
+        if version == _cached_version:
+            return _cached_lots
+
+    rows = ParkingLot.query.filter(ParkingLot.deleted_at.is_(None)).order_by(ParkingLot.id).all()
+    # Spots may sit in regional shards, so count them wherever they are stored
+    spot_counts = {}
+    for counts in fan_out(_count_spots):
+        spot_counts.update(counts)
+    lots = tuple(
+        LotRecord(
+            lot.id, lot.prime_location_name, lot.address, lot.pin_code, lot.price,
+            lot.latitude, lot.longitude, lot.maximum_number_of_spots, spot_counts.get(lot.id, 0)
+        )
+        for lot in rows
+    )
+    with _lock:
+        _cached_version, _cached_lots = version, lots
+    return lots
+
+
+def _count_spots(session):
+    return dict(session.query(ParkingSpot.lot_id, func.count(ParkingSpot.id)).group_by(ParkingSpot.lot_id).all())
+
+
+def search_lot_catalog(query):
+    """Case-insensitive match on pin code, name or address against the cached catalogue."""
+    query = query.lower()
+    return [
+        lot for lot in get_lot_catalog()
+        if query in lot.pin_code.lower()
+        or query in lot.prime_location_name.lower()
+        or query in lot.address.lower()
+    ]
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_catalog_versions(session, flush_context):
+    names = set()
+    if any(isinstance(obj, ParkingLot) for obj in session.new | session.deleted) \
+            or any(isinstance(obj, ParkingLot) and session.is_modified(obj) for obj in session.dirty) \
+            or any(isinstance(obj, ParkingSpot) for obj in session.new | session.deleted):
+        names.add(LOT_CATALOG)
+    # Spot grids also show status, so a booking or release changes them too
+    names.update(
+        spot_grid_catalog(obj.lot_id)
+        for obj in session.new | session.deleted | session.dirty
+        if isinstance(obj, ParkingSpot) and obj.lot_id is not None
+        and (obj not in session.dirty or session.is_modified(obj))
+    )
+    if not names:
+        return
+    if session.info.get('shard'):
+        # A shard has no catalog_version table; bump the main database once this commits
+        session.info.setdefault('bump_catalogs', set()).update(names)
+        return
+
+    # Bumped inside the writing transaction, so readers see the new version with the new data
+    for name in sorted(names):
+        _bump(session.connection(), name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_shard_commit(session):
+    names = session.info.pop('bump_catalogs', None)
+    if names:
+        with db.engine.begin() as connection:
+            for name in sorted(names):
+                _bump(connection, name)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_shard_bump(session):
+    session.info.pop('bump_catalogs', None)
+
+
+def _bump(connection, name=LOT_CATALOG):
+    result = connection.execute(
+        update(CatalogVersion)
+        .where(CatalogVersion.name == name)
+        .values(version=CatalogVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(CatalogVersion).values(name=name, version=1))
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "your-super-secret-key")
@@ -14,3 +15,89 @@ class Config:
     # Admin credentials
     ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
     ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+
+    # Seconds a rendered lot spot grid stays cached in each worker; changes are seen at once
+    # through the lot's spot version, so this only bounds memory
+    SPOT_GRID_CACHE_TTL = int(os.environ.get("SPOT_GRID_CACHE_TTL", 300))
+
+    # Reservations that ended this many days ago move to the archive table
+    RESERVATION_ARCHIVE_DAYS = int(os.environ.get("RESERVATION_ARCHIVE_DAYS", 90))
+    RESERVATION_ARCHIVE_BATCH_SIZE = int(os.environ.get("RESERVATION_ARCHIVE_BATCH_SIZE", 1000))
+
+    # Rate limiting state shared by all workers on the host
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+    RATE_LIMIT_DB = os.environ.get(
+        "RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "parkease_ratelimit.sqlite3")
+    )
+
+    # search_parking_ajax: tokens per second and burst per user (rate 0 turns the bucket off),
+    # concurrent requests per server
+    SEARCH_RATE = float(os.environ.get("SEARCH_RATE", 2))
+    SEARCH_BURST = int(os.environ.get("SEARCH_BURST", 5))
+    SEARCH_MAX_CONCURRENT = int(os.environ.get("SEARCH_MAX_CONCURRENT", 8))
+    SEARCH_QUEUE_TIMEOUT = float(os.environ.get("SEARCH_QUEUE_TIMEOUT", 0.2))
+
+    # (occupancy fraction reached, price multiplier) tiers, lowest first
+    SURGE_TIERS = [(0.0, 1.0), (0.7, 1.25), (0.9, 1.5)]
+
+    # Largest price matrix one quote request may ask for
+    QUOTE_MAX_LOTS = int(os.environ.get("QUOTE_MAX_LOTS", 100))
+    QUOTE_MAX_WINDOWS = int(os.environ.get("QUOTE_MAX_WINDOWS", 48))
+
+    # Seconds a finished day's hourly occupancy stays cached in each worker
+    OCCUPANCY_CACHE_TTL = int(os.environ.get("OCCUPANCY_CACHE_TTL", 7 * 24 * 3600))
+
+    # Deleting a lot or user hides it at once and purges its bookings in the background
+    SOFT_DELETE = os.environ.get("SOFT_DELETE", "1") == "1"
+    PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE", 5000))
+
+    # Structured event log (JSON lines); defaults to instance/events.jsonl
+    EVENT_LOG_PATH = os.environ.get("EVENT_LOG_PATH")
+    EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 10000))
+    # Fraction of each event kept, e.g. "login:0.1,expiry_release:0.5"; unlisted events are kept
+    EVENT_SAMPLE_RATES = {
+        name.strip(): float(rate)
+        for name, rate in (
+            item.split(":") for item in os.environ.get("EVENT_SAMPLE_RATES", "").split(",") if ":" in item
+        )
+    }
+
+    # Optional regional shards, e.g. "56,57=sqlite:///south.db;11=sqlite:///delhi.db": lots whose
+    # pin code starts with a listed prefix keep their spots and bookings in that database
+    SHARDS = [
+        ([prefix.strip() for prefix in prefixes.split(",") if prefix.strip()], url.strip())
+        for prefixes, url in (
+            item.split("=", 1) for item in os.environ.get("SHARD_DATABASES", "").split(";") if "=" in item
+        )
+    ]
+    SQLALCHEMY_BINDS = {f"shard{i}": url for i, (_, url) in enumerate(SHARDS, start=1)}
+    # Threads used to query every shard at once for admin totals
+    SHARD_FANOUT_WORKERS = int(os.environ.get("SHARD_FANOUT_WORKERS", 8))
+
+    # Outgoing mail through Flask-Mail; messages are queued in email_job and sent by a worker
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "localhost")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 25))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "0") == "1"
+    MAIL_USE_SSL = os.environ.get("MAIL_USE_SSL", "0") == "1"
+    MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
+    MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
+    MAIL_DEFAULT_SENDER = os.environ.get("MAIL_DEFAULT_SENDER", "ParkEase <no-reply@parkease.local>")
+    # The worker runs inside the web process once MAIL_SERVER is set; `flask send-mail` drains it by hand
+    MAIL_WORKER_ENABLED = os.environ.get("MAIL_WORKER_ENABLED", "1" if os.environ.get("MAIL_SERVER") else "0") == "1"
+    MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 50))
+    MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 5))
+    MAIL_RETRY_SECONDS = int(os.environ.get("MAIL_RETRY_SECONDS", 30))
+    MAIL_POLL_SECONDS = float(os.environ.get("MAIL_POLL_SECONDS", 5))
+    MAIL_REMINDER_MINUTES = int(os.environ.get("MAIL_REMINDER_MINUTES", 15))
+
+    # Waitlist for full lots: "fifo" serves the longest-waiting user, "best_fit" the window that
+    # fills a freed spot's gap before its next booking most closely
+    WAITLIST_POLICY = os.environ.get("WAITLIST_POLICY", "fifo")
+    # Minutes a waitlisted user has to take up an offered spot before it goes to the next in line
+    WAITLIST_OFFER_MINUTES = int(os.environ.get("WAITLIST_OFFER_MINUTES", 10))
+
+    # On-demand profiling: an admin adds ?_profile=1 or an "X-Profile: 1" header to any request
+    PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "1") == "1"
+    # Seconds between stack samples of the profiled request, and how many reports are kept
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.001))
+    PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
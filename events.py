@@ -0,0 +1,108 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler
+
+logger = logging.getLogger('parkease.events')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_sample_rates = {}
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks a request: events are dropped when the queue is full."""
+
+    def __init__(self, event_queue):
+        super().__init__(event_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Keep the raw record; the writer thread does the JSON encoding
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesWriter(threading.Thread):
+    """Background thread draining the event queue into a JSON-lines file in batches."""
+
+    def __init__(self, event_queue, path, batch_size=200, flush_interval=1.0):
+        super().__init__(name='event-log-writer', daemon=True)
+        self.queue = event_queue
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, records):
+        lines = []
+        for record in records:
+            entry = {
+                'ts': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+                'event': record.getMessage(),
+                'pid': record.process,
+            }
+            entry.update(getattr(record, 'fields', {}))
+            lines.append(json.dumps(entry, default=str))
+        try:
+            # One append per batch keeps lines from different workers whole
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            logging.getLogger(__name__).warning("Could not write %d events: %s", len(lines), e)
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self.join(timeout)
+
+
+def log_event(name, **fields):
+    """Record a structured event without blocking the caller.
+
+    Events listed in EVENT_SAMPLE_RATES are kept with that probability; the
+    kept fraction is written with the event so counts can be scaled back up.
+    """
+    rate = _sample_rates.get(name, 1.0)
+    if rate < 1.0:
+        if random.random() >= rate:
+            return
+        fields['sample_rate'] = rate
+    logger.info(name, extra={'fields': fields})
+
+
+def init_events(app):
+    if any(isinstance(h, DroppingQueueHandler) for h in logger.handlers):
+        return
+
+    path = app.config.get('EVENT_LOG_PATH') or os.path.join(app.instance_path, 'events.jsonl')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _sample_rates.update(app.config.get('EVENT_SAMPLE_RATES', {}))
+
+    event_queue = queue.Queue(maxsize=app.config.get('EVENT_QUEUE_SIZE', 10000))
+    writer = JsonLinesWriter(event_queue, path)
+    writer.start()
+    logger.addHandler(DroppingQueueHandler(event_queue))
+    atexit.register(writer.stop)
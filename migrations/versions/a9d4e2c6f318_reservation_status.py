@@ -0,0 +1,69 @@
+"""reservation status
+
+Revision ID: a9d4e2c6f318
+Revises: f1b6c8d2e904
+Create Date: 2026-10-19 16:12:44.901273
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e2c6f318'
+down_revision = 'f1b6c8d2e904'
+branch_labels = None
+depends_on = None
+
+LIVE = sa.text("status IN ('booked', 'active')")
+
+
+def upgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=10), nullable=False, server_default='booked'))
+
+    # Existing rows only have timestamps to go on; cancellations read as completed
+    op.execute(
+        sa.text(
+            "UPDATE reservation SET status = CASE "
+            "WHEN leaving_timestamp < :now THEN 'completed' "
+            "WHEN parking_timestamp <= :now THEN 'active' "
+            "ELSE 'booked' END"
+        ).bindparams(now=datetime.now())
+    )
+
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.alter_column('status', server_default=None)
+        batch_op.create_index('ix_reservation_live_spot', ['spot_id', 'parking_timestamp'], unique=False,
+                              postgresql_where=LIVE, sqlite_where=LIVE)
+        batch_op.create_index('ix_reservation_live_user', ['user_id', 'parking_timestamp'], unique=False,
+                              postgresql_where=LIVE, sqlite_where=LIVE)
+        batch_op.create_index('ix_reservation_live_leaving', ['leaving_timestamp'], unique=False,
+                              postgresql_where=LIVE, sqlite_where=LIVE)
+
+    with op.batch_alter_table('archived_reservation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=10), nullable=False, server_default='completed'))
+    with op.batch_alter_table('archived_reservation', schema=None) as batch_op:
+        batch_op.alter_column('status', server_default=None)
+
+    # Spot status follows the live bookings from now on; line up rows that drifted
+    op.execute(
+        "UPDATE parking_spot SET status = CASE WHEN EXISTS ("
+        "SELECT 1 FROM reservation WHERE reservation.spot_id = parking_spot.id "
+        "AND reservation.status IN ('booked', 'active')) THEN 'O' ELSE 'A' END"
+    )
+    # Counters were clamped at zero before; rebuild them from the status column on next read
+    op.execute("DELETE FROM user_stats")
+
+
+def downgrade():
+    with op.batch_alter_table('archived_reservation', schema=None) as batch_op:
+        batch_op.drop_column('status')
+
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_reservation_live_leaving')
+        batch_op.drop_index('ix_reservation_live_user')
+        batch_op.drop_index('ix_reservation_live_spot')
+        batch_op.drop_column('status')
@@ -0,0 +1,52 @@
+"""email queue
+
+Revision ID: b7e1f4a8c392
+Revises: a9d4e2c6f318
+Create Date: 2026-10-19 17:02:18.334610
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1f4a8c392'
+down_revision = 'a9d4e2c6f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('email', sa.String(length=200), nullable=True))
+
+    op.create_table('email_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('recipient', sa.String(length=200), nullable=False),
+    sa.Column('subject', sa.String(length=200), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('reservation_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claimed_by', sa.String(length=32), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('email_job', schema=None) as batch_op:
+        batch_op.create_index('ix_email_job_due', ['status', 'next_attempt_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_email_job_reservation_id'), ['reservation_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_email_job_reservation_id'))
+        batch_op.drop_index('ix_email_job_due')
+
+    op.drop_table('email_job')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('email')
@@ -0,0 +1,47 @@
+"""reservation archive
+
+Revision ID: c4a1d2e7f903
+Revises: b2064fc5d2e1
+Create Date: 2026-10-19 10:12:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a1d2e7f903'
+down_revision = 'b2064fc5d2e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_reservation',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('parking_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('leaving_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('parking_cost', sa.Float(), nullable=True),
+    sa.Column('rating', sa.Integer(), nullable=True),
+    sa.Column('feedback', sa.Text(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_reservation_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservation_leaving_timestamp'), ['leaving_timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservation_leaving_timestamp'))
+
+    with op.batch_alter_table('archived_reservation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_reservation_user_id'))
+
+    op.drop_table('archived_reservation')
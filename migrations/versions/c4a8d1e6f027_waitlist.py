@@ -0,0 +1,53 @@
+"""waitlist
+
+Revision ID: c4a8d1e6f027
+Revises: b7e1f4a8c392
+Create Date: 2026-10-19 18:21:47.612905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8d1e6f027'
+down_revision = 'b7e1f4a8c392'
+branch_labels = None
+depends_on = None
+
+WAITING = sa.text("status = 'waiting'")
+OFFERED = sa.text("status = 'offered'")
+
+
+def upgrade():
+    op.create_table('waitlist_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('window_start', sa.DateTime(), nullable=False),
+    sa.Column('window_end', sa.DateTime(), nullable=False),
+    sa.Column('auto_book', sa.Boolean(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=True),
+    sa.Column('reservation_id', sa.Integer(), nullable=True),
+    sa.Column('offer_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lot_id'], ['parking_lot.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('waitlist_entry', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_waitlist_entry_user_id'), ['user_id'], unique=False)
+        batch_op.create_index('ix_waitlist_waiting_end', ['lot_id', 'window_end'], unique=False,
+                              postgresql_where=WAITING, sqlite_where=WAITING)
+        batch_op.create_index('ix_waitlist_offer_expiry', ['offer_expires_at'], unique=False,
+                              postgresql_where=OFFERED, sqlite_where=OFFERED)
+
+
+def downgrade():
+    with op.batch_alter_table('waitlist_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_waitlist_offer_expiry')
+        batch_op.drop_index('ix_waitlist_waiting_end')
+        batch_op.drop_index(batch_op.f('ix_waitlist_entry_user_id'))
+
+    op.drop_table('waitlist_entry')
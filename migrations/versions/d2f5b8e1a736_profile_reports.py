@@ -0,0 +1,38 @@
+"""profile reports
+
+Revision ID: d2f5b8e1a736
+Revises: c4a8d1e6f027
+Create Date: 2026-10-19 19:05:12.408331
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f5b8e1a736'
+down_revision = 'c4a8d1e6f027'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('profile_report',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('method', sa.String(length=10), nullable=False),
+    sa.Column('path', sa.String(length=500), nullable=False),
+    sa.Column('endpoint', sa.String(length=100), nullable=True),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('duration_ms', sa.Float(), nullable=False),
+    sa.Column('cpu_ms', sa.Float(), nullable=False),
+    sa.Column('sql_count', sa.Integer(), nullable=False),
+    sa.Column('sql_ms', sa.Float(), nullable=False),
+    sa.Column('samples', sa.Integer(), nullable=False),
+    sa.Column('report', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('profile_report')
@@ -0,0 +1,29 @@
+"""catalog version
+
+Revision ID: d7e3b9a4c215
+Revises: c4a1d2e7f903
+Create Date: 2026-10-19 14:05:12.406771
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e3b9a4c215'
+down_revision = 'c4a1d2e7f903'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_version = op.create_table('catalog_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(catalog_version, [{'name': 'lots', 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
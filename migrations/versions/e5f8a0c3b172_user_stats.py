@@ -0,0 +1,33 @@
+"""user stats
+
+Revision ID: e5f8a0c3b172
+Revises: d7e3b9a4c215
+Create Date: 2026-10-19 14:48:30.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f8a0c3b172'
+down_revision = 'd7e3b9a4c215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_bookings', sa.Integer(), nullable=False),
+    sa.Column('active_bookings', sa.Integer(), nullable=False),
+    sa.Column('total_spent', sa.Float(), nullable=False),
+    sa.Column('last_booking_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Rows are filled by `flask rebuild-user-stats`, or lazily on first dashboard load
+
+
+def downgrade():
+    op.drop_table('user_stats')
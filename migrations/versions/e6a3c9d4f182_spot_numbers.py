@@ -0,0 +1,38 @@
+"""spot numbers
+
+Revision ID: e6a3c9d4f182
+Revises: d2f5b8e1a736
+Create Date: 2026-10-19 20:41:37.512094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a3c9d4f182'
+down_revision = 'd2f5b8e1a736'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('parking_spot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('number', sa.Integer(), nullable=True))
+
+    # Existing spots are numbered in the order they were added to their lot
+    op.execute(
+        "UPDATE parking_spot SET number = ("
+        "SELECT COUNT(*) FROM parking_spot AS earlier "
+        "WHERE earlier.lot_id = parking_spot.lot_id AND earlier.id <= parking_spot.id)"
+    )
+
+    with op.batch_alter_table('parking_spot', schema=None) as batch_op:
+        batch_op.alter_column('number', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_unique_constraint('uq_parking_spot_lot_number', ['lot_id', 'number'])
+
+
+def downgrade():
+    with op.batch_alter_table('parking_spot', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_parking_spot_lot_number', type_='unique')
+        batch_op.drop_column('number')
@@ -0,0 +1,71 @@
+"""cascading deletes and soft delete
+
+Revision ID: f1b6c8d2e904
+Revises: e5f8a0c3b172
+Create Date: 2026-10-19 15:31:07.284113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6c8d2e904'
+down_revision = 'e5f8a0c3b172'
+branch_labels = None
+depends_on = None
+
+# Matches Postgres' default names and lets batch mode find SQLite's unnamed constraints
+naming_convention = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+# (table, column, referenced table)
+FOREIGN_KEYS = [
+    ('parking_spot', 'lot_id', 'parking_lot'),
+    ('reservation', 'spot_id', 'parking_spot'),
+    ('reservation', 'user_id', 'user'),
+    ('archived_reservation', 'user_id', 'user'),
+    ('user_stats', 'user_id', 'user'),
+]
+
+
+def _replace_foreign_keys(ondelete):
+    for table, column, referenced in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referenced, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    # Cascades and the purge worker look children up by these columns
+    with op.batch_alter_table('parking_spot', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_parking_spot_lot_id'), ['lot_id'], unique=False)
+
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_reservation_spot_id'), ['spot_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_reservation_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_reservation_user_id'))
+        batch_op.drop_index(batch_op.f('ix_reservation_spot_id'))
+
+    with op.batch_alter_table('parking_spot', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_parking_spot_lot_id'))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
+
+    with op.batch_alter_table('parking_lot', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
+
+    _replace_foreign_keys(None)
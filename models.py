@@ -1,16 +1,36 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import event, bindparam
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+# SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked per connection
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+# Reservation.status values: booked and active are live, completed and cancelled are final
+BOOKED, ACTIVE, COMPLETED, CANCELLED = 'booked', 'active', 'completed', 'cancelled'
+LIVE_STATUSES = (BOOKED, ACTIVE)
+
 # User model for authentication and authorization
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True) #primary key
     username = db.Column(db.String(100), unique=True, nullable=False) #unique username
     password = db.Column(db.String(200), nullable=False) #hashed password
     role = db.Column(db.String(20), default='user')  # set role default as 'user'
-    reservations = db.relationship('Reservation', backref='user', cascade="all, delete", lazy=True) # relationship to Reservation model
+    email = db.Column(db.String(200), nullable=True) # optional; booking emails are only sent when set
+    deleted_at = db.Column(db.DateTime, nullable=True) # set on soft delete; row is purged in the background
+    # Children are removed by ON DELETE CASCADE in the database, never loaded for deletion
+    reservations = db.relationship('Reservation', backref='user', cascade="all, delete", passive_deletes=True, lazy=True) # relationship to Reservation model
+    archived_reservations = db.relationship('ArchivedReservation', backref='user', cascade="all, delete", passive_deletes=True, lazy=True) # relationship to ArchivedReservation model
+    stats = db.relationship('UserStats', uselist=False, cascade="all, delete", passive_deletes=True, lazy=True) # running booking counters
 
 # ParkingLotfor the parking system
 class ParkingLot(db.Model):
@@ -24,30 +44,169 @@ class ParkingLot(db.Model):
     # Optional for accurate map links
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
+    deleted_at = db.Column(db.DateTime, nullable=True) # set on soft delete; row is purged in the background
 
-    spots = db.relationship('ParkingSpot', backref='lot', cascade="all, delete", lazy=True) # relationship to ParkingSpot model
+    spots = db.relationship('ParkingSpot', backref='lot', cascade="all, delete", passive_deletes=True, lazy=True) # relationship to ParkingSpot model
 
 # ParkingSpot models for the parking system
 class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True) #primary key
-    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False) # foreign key to ParkingLot
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id', ondelete='CASCADE'), nullable=False, index=True) # foreign key to ParkingLot
     status = db.Column(db.String(1), default='A')  # A - Available, O - Occupied 
+    number = db.Column(db.Integer, nullable=False) # 1, 2, ... within its lot; shown to users, as ids are global across shards
+
+    __table_args__ = (
+        db.UniqueConstraint('lot_id', 'number', name='uq_parking_spot_lot_number'),
+    )
 
-    reservations = db.relationship('Reservation', backref='spot', cascade="all, delete", lazy=True) # relationship to Reservation model
+    reservations = db.relationship('Reservation', backref='spot', cascade="all, delete", passive_deletes=True, lazy=True) # relationship to Reservation model
 
 # Reservation models for the parking system
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True) #primary key
-    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)  # foreign key to ParkingSpot
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # foreign key to User
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id', ondelete='CASCADE'), nullable=False, index=True)  # foreign key to ParkingSpot
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True) # foreign key to User
     parking_timestamp = db.Column(db.DateTime, default=datetime.utcnow) # timestamp when the reservation was made
-    leaving_timestamp = db.Column(db.DateTime, nullable=True) # timestamp when the user leaves
+    leaving_timestamp = db.Column(db.DateTime, nullable=True, index=True) # timestamp when the user leaves
     parking_cost = db.Column(db.Float, nullable=True) # cost of the parking reservation
     # New fields for feedback
     rating = db.Column(db.Integer, nullable=True)
     feedback = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default=BOOKED) # booked -> active -> completed, or cancelled
+
+    # Partial indexes cover live rows only, so availability and expiry checks never scan history
+    __table_args__ = (
+        db.Index('ix_reservation_live_spot', 'spot_id', 'parking_timestamp',
+                 postgresql_where=status.in_(LIVE_STATUSES), sqlite_where=status.in_(LIVE_STATUSES)),
+        db.Index('ix_reservation_live_user', 'user_id', 'parking_timestamp',
+                 postgresql_where=status.in_(LIVE_STATUSES), sqlite_where=status.in_(LIVE_STATUSES)),
+        db.Index('ix_reservation_live_leaving', 'leaving_timestamp',
+                 postgresql_where=status.in_(LIVE_STATUSES), sqlite_where=status.in_(LIVE_STATUSES)),
+    )
+
+    # Allowed status changes; checked by move_to in memory and by can_move_to in SQL
+    TRANSITIONS = {
+        BOOKED: (ACTIVE, COMPLETED, CANCELLED),
+        ACTIVE: (COMPLETED, CANCELLED),
+        COMPLETED: (),
+        CANCELLED: (),
+    }
+
+    @classmethod
+    def live(cls):
+        """status IN (booked, active), rendered inline so the planner can match the partial indexes."""
+        return cls.status.in_(
+            bindparam('live_statuses', LIVE_STATUSES, expanding=True, literal_execute=True, unique=True)
+        )
+
+    @classmethod
+    def can_move_to(cls, status):
+        """SQL condition matching rows whose current status may change to `status`."""
+        return cls.status.in_([start for start, targets in cls.TRANSITIONS.items() if status in targets])
+
+    def move_to(self, status):
+        if status not in self.TRANSITIONS[self.status]:
+            raise ValueError(f"This booking is already {self.status}.")
+        self.status = status
 
     @property # to get the ParkingSpot object
     def lot(self):
-        return self.spot.lot if self.spot else None 
-    
+        return self.spot.lot if self.spot else None
+
+# Per-user booking counters kept up to date by the booking, checkout and cancel paths
+class UserStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True) # one row per user
+    total_bookings = db.Column(db.Integer, nullable=False, default=0) # every booking ever made, archived included
+    active_bookings = db.Column(db.Integer, nullable=False, default=0) # booked and not yet ended
+    total_spent = db.Column(db.Float, nullable=False, default=0) # sum of parking_cost
+    last_booking_at = db.Column(db.DateTime, nullable=True) # start of the most recent booking
+
+# Version counter bumped whenever cached catalogues (e.g. parking lots) change
+class CatalogVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True) # catalogue name, e.g. 'lots'
+    version = db.Column(db.Integer, nullable=False, default=0) # incremented on every write
+
+# Closed reservations moved out of the hot reservation table by the archiver
+class ArchivedReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False) # original reservation id
+    spot_id = db.Column(db.Integer, nullable=False) # spot may be deleted later, so no foreign key
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True) # foreign key to User
+    parking_timestamp = db.Column(db.DateTime, nullable=True)
+    leaving_timestamp = db.Column(db.DateTime, nullable=True)
+    parking_cost = db.Column(db.Float, nullable=True)
+    rating = db.Column(db.Integer, nullable=True)
+    feedback = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(10), nullable=False, default=COMPLETED) # final status when archived
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow) # when the row was moved here
+
+    spot = db.relationship(
+        'ParkingSpot',
+        primaryjoin='foreign(ArchivedReservation.spot_id) == ParkingSpot.id',
+        viewonly=True
+    ) # read-only link to the spot while it still exists
+
+    @property # to get the ParkingLot while the spot still exists
+    def lot(self):
+        return self.spot.lot if self.spot else None
+
+# Outgoing emails, written with the booking change and sent in batches by the mail worker
+class EmailJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True) #primary key
+    kind = db.Column(db.String(20), nullable=False) # confirmation, reminder or receipt
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    reservation_id = db.Column(db.Integer, nullable=True, index=True) # booking it is about; may live in a shard, so no foreign key
+    status = db.Column(db.String(10), nullable=False, default='pending') # pending, sending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0) # failed send attempts so far
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now) # when due; while sending, when the claim lapses
+    claimed_by = db.Column(db.String(32), nullable=True) # token of the worker sending it
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_job_due', 'status', 'next_attempt_at'),
+    )
+
+# A user queued for a full lot; checkout, cancel and expiry offer or book freed spots to the queue
+class WaitlistEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True) #primary key; also the first-come order
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True) # foreign key to User
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id', ondelete='CASCADE'), nullable=False) # foreign key to ParkingLot
+    window_start = db.Column(db.DateTime, nullable=False) # earliest start wanted; a later match books the rest of the window
+    window_end = db.Column(db.DateTime, nullable=False)
+    auto_book = db.Column(db.Boolean, nullable=False, default=False) # book a freed spot at once instead of offering it
+    status = db.Column(db.String(10), nullable=False, default='waiting') # waiting, offered, booked, expired or left
+    spot_id = db.Column(db.Integer, nullable=True) # spot offered or booked; may live in a shard, so no foreign key
+    reservation_id = db.Column(db.Integer, nullable=True) # booking made from this entry
+    offer_expires_at = db.Column(db.DateTime, nullable=True) # an offer not taken by then lapses
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Each lot's queue is a range of a partial index over waiting rows, so matching never reads other lots or served history
+    __table_args__ = (
+        db.Index('ix_waitlist_waiting_end', 'lot_id', 'window_end',
+                 postgresql_where=status == 'waiting', sqlite_where=status == 'waiting'),
+        db.Index('ix_waitlist_offer_expiry', 'offer_expires_at',
+                 postgresql_where=status == 'offered', sqlite_where=status == 'offered'),
+    )
+
+    @classmethod
+    def with_status(cls, status):
+        """status = <status>, rendered inline so the planner can match the partial indexes."""
+        return cls.status == bindparam('waitlist_status', status, literal_execute=True, unique=True)
+
+# Profile of one request, captured when an admin asks for it with ?_profile=1 or an X-Profile header
+class ProfileReport(db.Model):
+    id = db.Column(db.Integer, primary_key=True) #primary key
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500), nullable=False) # path with query string
+    endpoint = db.Column(db.String(100), nullable=True)
+    status_code = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=False) # wall time from before_request to after_request
+    cpu_ms = db.Column(db.Float, nullable=False) # CPU time of the request thread
+    sql_count = db.Column(db.Integer, nullable=False, default=0)
+    sql_ms = db.Column(db.Float, nullable=False, default=0)
+    samples = db.Column(db.Integer, nullable=False, default=0) # stack samples taken
+    report = db.Column(db.Text, nullable=False) # JSON: call tree, collapsed stacks and SQL statements
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
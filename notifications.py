@@ -0,0 +1,214 @@
+import logging
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import render_template
+from flask_mail import Mail, Message, BadHeaderError
+from sqlalchemy import event, update, select
+from sqlalchemy.orm import Session
+from models import db, EmailJob
+from events import log_event
+
+mail = Mail()
+logger = logging.getLogger(__name__)
+
+SUBJECTS = {
+    'confirmation': "Your ParkEase booking #{booking_id} is confirmed",
+    'reminder': "Your ParkEase booking #{booking_id} ends soon",
+    'receipt': "Your ParkEase receipt for booking #{booking_id}",
+    'waitlist_offer': "A spot is free at {lot_name}",
+}
+
+# Errors that concern one message; anything else from SMTP is treated as a broken connection
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused, BadHeaderError)
+
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+
+
+# ----------------------------
+# Queueing
+# ----------------------------
+def enqueue_email(kind, recipient, reservation_id=None, send_at=None, **context):
+    """Render an email and queue it in the caller's transaction; the caller commits."""
+    context['booking_id'] = reservation_id
+    db.session.add(EmailJob(
+        kind=kind,
+        recipient=recipient,
+        subject=SUBJECTS[kind].format(**context),
+        body=render_template(f'email/{kind}.txt', **context),
+        reservation_id=reservation_id,
+        next_attempt_at=send_at or datetime.now(),
+    ))
+    db.session.info['mail_queued'] = True
+
+
+def queue_booking_emails(user, reservation, lot_name, reminder_minutes):
+    """Confirmation now, and a reminder shortly before the booking ends."""
+    if not user.email:
+        return
+    context = dict(username=user.username, spot_number=reservation.spot.number, lot_name=lot_name,
+                   start=reservation.parking_timestamp, end=reservation.leaving_timestamp,
+                   cost=reservation.parking_cost)
+    enqueue_email('confirmation', user.email, reservation.id, **context)
+    remind_at = reservation.leaving_timestamp - timedelta(minutes=reminder_minutes)
+    if remind_at > reservation.parking_timestamp:
+        enqueue_email('reminder', user.email, reservation.id, send_at=remind_at, **context)
+
+
+def queue_checkout_receipt(user, reservation, lot_name):
+    if not user.email:
+        return
+    enqueue_email('receipt', user.email, reservation.id, username=user.username, spot_number=reservation.spot.number,
+                  lot_name=lot_name, start=reservation.parking_timestamp, end=reservation.leaving_timestamp,
+                  cost=reservation.parking_cost)
+
+
+def cancel_reminders(reservation_ids):
+    """Drop reminders for bookings that closed before their reminder went out."""
+    if reservation_ids:
+        EmailJob.query.filter(
+            EmailJob.reservation_id.in_(reservation_ids),
+            EmailJob.kind == 'reminder',
+            EmailJob.status == 'pending'
+        ).delete(synchronize_session=False)
+
+
+def discard_booking_emails(reservation_ids):
+    """Drop every unsent email about bookings that are being deleted."""
+    if reservation_ids:
+        EmailJob.query.filter(
+            EmailJob.reservation_id.in_(reservation_ids),
+            EmailJob.status == 'pending'
+        ).delete(synchronize_session=False)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_mail_worker(session):
+    # Wake only once the jobs are committed, or the worker could look before they exist
+    if session.info.pop('mail_queued', False):
+        _wake.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_mail_queued(session):
+    session.info.pop('mail_queued', None)
+
+
+# ----------------------------
+# Sending
+# ----------------------------
+def claim_due_jobs(batch_size, lease_seconds=300):
+    """Mark up to batch_size due jobs as ours and return them.
+
+    Claims are leases: a worker that dies mid-batch leaves its jobs to be
+    picked up again once next_attempt_at passes, so delivery is at least once.
+    """
+    now = datetime.now()
+    token = uuid.uuid4().hex
+    due = (EmailJob.status.in_(('pending', 'sending')), EmailJob.next_attempt_at <= now)
+    db.session.execute(
+        update(EmailJob)
+        .where(EmailJob.id.in_(select(EmailJob.id).where(*due).order_by(EmailJob.next_attempt_at).limit(batch_size)))
+        .where(*due)
+        .values(status='sending', claimed_by=token, next_attempt_at=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return EmailJob.query.filter_by(claimed_by=token, status='sending').order_by(EmailJob.id).all()
+
+
+def _retry_later(job, error, max_attempts, retry_seconds):
+    job.attempts += 1
+    job.last_error = str(error)[:1000]
+    job.claimed_by = None
+    if job.attempts >= max_attempts:
+        job.status = 'failed'
+        log_event('email_failed', job_id=job.id, kind=job.kind, attempts=job.attempts, error=job.last_error)
+    else:
+        # Exponential backoff, capped at an hour
+        job.status = 'pending'
+        job.next_attempt_at = datetime.now() + timedelta(seconds=min(retry_seconds * 2 ** (job.attempts - 1), 3600))
+
+
+def send_due_emails(batch_size=50, max_attempts=5, retry_seconds=30):
+    """Send one batch of due emails over a single SMTP connection. Returns the number claimed."""
+    jobs = claim_due_jobs(batch_size)
+    if not jobs:
+        return 0
+
+    try:
+        with mail.connect() as connection:
+            for job in jobs:
+                try:
+                    connection.send(Message(job.subject, recipients=[job.recipient], body=job.body))
+                except MESSAGE_ERRORS as e:
+                    _retry_later(job, e, max_attempts, retry_seconds)
+                    continue
+                job.status = 'sent'
+                job.sent_at = datetime.utcnow()
+                job.claimed_by = None
+    except (smtplib.SMTPException, OSError) as e:
+        # The connection failed; whatever was not sent yet goes back on the queue
+        for job in jobs:
+            if job.status == 'sending':
+                _retry_later(job, e, max_attempts, retry_seconds)
+    db.session.commit()
+
+    sent = sum(1 for job in jobs if job.status == 'sent')
+    log_event('email_batch', claimed=len(jobs), sent=sent)
+    return len(jobs)
+
+
+def drain_email_queue(app):
+    """Send batches until nothing is due. Returns the number of jobs handled."""
+    handled = 0
+    while True:
+        claimed = send_due_emails(
+            app.config['MAIL_BATCH_SIZE'], app.config['MAIL_MAX_ATTEMPTS'], app.config['MAIL_RETRY_SECONDS']
+        )
+        handled += claimed
+        if claimed < app.config['MAIL_BATCH_SIZE']:
+            return handled
+
+
+def start_mail_worker(app):
+    """Drain the queue on a background thread, woken by new jobs or every MAIL_POLL_SECONDS."""
+    global _worker
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    drain_email_queue(app)
+                except Exception:
+                    db.session.rollback()
+                    logger.exception("Mail worker pass failed; retrying on the next poll")
+            _wake.wait(app.config['MAIL_POLL_SECONDS'])
+            _wake.clear()
+
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=run, name='mail-worker', daemon=True)
+        _worker.start()
+
+
+def init_notifications(app):
+    mail.init_app(app)
+
+    if app.config.get('MAIL_WORKER_ENABLED'):
+        # Started by the first request, so CLI commands such as `flask db upgrade` never run it
+        @app.before_request
+        def ensure_mail_worker():
+            start_mail_worker(app)
+
+    @app.cli.command('send-mail')
+    def send_mail_command():
+        """Send every queued email that is due."""
+        handled = drain_email_queue(app)
+        click.echo(f"Processed {handled} queued emails")
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, case
+from models import ParkingSpot
+from sharding import fan_out_lots
+from cache import TTLCache
+from config import Config
+
+# Effective hourly rate keyed by (lot id, base price, clock hour), so an edited price
+# is picked up at once in every worker
+_rate_cache = TTLCache(ttl=3600)
+
+_SURGE_THRESHOLDS = np.array([threshold for threshold, _ in Config.SURGE_TIERS], dtype=float)
+_SURGE_MULTIPLIERS = np.array([multiplier for _, multiplier in Config.SURGE_TIERS], dtype=float)
+
+
+def get_lot_occupancy(lot_ids):
+    """Fraction of non-available spots for each lot id, in the order given."""
+    counts = {}
+    for rows in fan_out_lots(_count_occupied, lot_ids):
+        counts.update((lot_id, (total, occupied or 0)) for lot_id, total, occupied in rows)
+    totals = np.array([counts.get(lot_id, (0, 0))[0] for lot_id in lot_ids], dtype=float)
+    occupied = np.array([counts.get(lot_id, (0, 0))[1] for lot_id in lot_ids], dtype=float)
+    return np.divide(occupied, totals, out=np.zeros_like(occupied), where=totals > 0)
+
+
+def _count_occupied(session, lot_ids):
+    return (
+        session.query(
+            ParkingSpot.lot_id,
+            func.count(ParkingSpot.id),
+            func.sum(case((ParkingSpot.status != 'A', 1), else_=0))
+        )
+        .filter(ParkingSpot.lot_id.in_(lot_ids))
+        .group_by(ParkingSpot.lot_id)
+        .all()
+    )
+
+
+def surge_multipliers(occupancy):
+    """Map occupancy fractions to the multiplier of the highest tier reached."""
+    tier = np.searchsorted(_SURGE_THRESHOLDS, occupancy, side='right') - 1
+    return _SURGE_MULTIPLIERS[np.clip(tier, 0, None)]
+
+
+def get_hourly_rates(lots, now=None):
+    """Effective hourly rate for each lot, fixed for the current clock hour."""
+    hour = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    rates = np.empty(len(lots), dtype=float)
+    missing = []
+    for i, lot in enumerate(lots):
+        cached = _rate_cache.get((lot.id, lot.price, hour))
+        if cached is None:
+            missing.append(i)
+        else:
+            rates[i] = cached
+
+    if missing:
+        # Earlier hours' rates are never read again
+        _rate_cache.prune()
+        base = np.array([lots[i].price for i in missing], dtype=float)
+        occupancy = get_lot_occupancy([lots[i].id for i in missing])
+        fresh = base * surge_multipliers(occupancy)
+        rates[missing] = fresh
+        for i, rate in zip(missing, fresh):
+            _rate_cache.set((lots[i].id, lots[i].price, hour), float(rate))
+    return rates
+
+
+def billable_hours(windows):
+    """Hours charged per (start, end) window, rounded up to the nearest hour."""
+    starts = np.array([start for start, _ in windows], dtype='datetime64[us]')
+    ends = np.array([end for _, end in windows], dtype='datetime64[us]')
+    hours = (ends - starts) / np.timedelta64(1, 'h')
+    return np.floor(hours + 0.9999)
+
+
+def quote_prices(lots, windows, now=None):
+    """Price every lot for every window in one pass.
+
+    Returns an array where result[i, j] is the cost of lots[i] over windows[j].
+    """
+    if not lots or not windows:
+        return np.zeros((len(lots), len(windows)))
+    return np.outer(get_hourly_rates(lots, now), billable_hours(windows))
@@ -0,0 +1,239 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import Flask, g, request, session
+from sqlalchemy import event, insert, delete, select
+from sqlalchemy.engine import Engine
+from models import db, ProfileReport
+from events import log_event
+
+# The profile collecting for the current request; fan_out copies it into shard workers
+_active = ContextVar('active_profile', default=None)
+
+MAX_STATEMENT_CHARS = 2000
+
+
+# ----------------------------
+# Stack sampling
+# ----------------------------
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts.
+
+    While the sampled thread holds the GIL the sampler only runs every
+    sys.getswitchinterval() (5 ms by default), so CPU-bound stretches are
+    sampled more coarsely than time spent waiting on the database.
+    """
+
+    def __init__(self, thread_id, interval, root_path):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_path = root_path
+        self.stacks = Counter()
+        self._labels = {}
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._stack(frame)] += 1
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            # Frames below Flask's WSGI entry point are the server's, the same on every request
+            if code is Flask.wsgi_app.__code__:
+                break
+            labels.append(self._label(code))
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+    def _label(self, code):
+        if code not in self._labels:
+            filename = code.co_filename
+            if filename.startswith(self.root_path):
+                filename = os.path.relpath(filename, self.root_path)
+            else:
+                filename = os.path.join(*filename.split(os.sep)[-2:])
+            # ';' separates frames in collapsed stacks
+            self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ',')
+        return self._labels[code]
+
+
+def build_call_tree(stacks):
+    """Nest collapsed stacks into {'name', 'samples', 'children'} nodes, busiest child first."""
+    root = {'name': 'request', 'samples': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['samples'] += count
+        for label in stack:
+            node = node['children'].setdefault(label, {'name': label, 'samples': 0, 'children': {}})
+            node['samples'] += count
+
+    def finish(node):
+        node['children'] = sorted((finish(child) for child in node['children'].values()),
+                                  key=lambda child: child['samples'], reverse=True)
+        return node
+    return finish(root)
+
+
+def flatten_call_tree(tree, min_share=0.01):
+    """(depth, name, samples, self samples) rows in display order, skipping nodes under min_share."""
+    rows = []
+    cutoff = tree['samples'] * min_share
+
+    def walk(node, depth):
+        own = node['samples'] - sum(child['samples'] for child in node['children'])
+        rows.append((depth, node['name'], node['samples'], own))
+        for child in node['children']:
+            if child['samples'] >= cutoff:
+                walk(child, depth + 1)
+    walk(tree, 0)
+    return rows
+
+
+def collapsed_stacks(stacks):
+    """flamegraph.pl / speedscope input: one 'frame;frame;frame count' line per stack."""
+    return '\n'.join(f"{';'.join(('request',) + stack)} {count}" for stack, count in stacks.most_common())
+
+
+# ----------------------------
+# SQL capture
+# ----------------------------
+@event.listens_for(Engine, 'before_cursor_execute')
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    # One context variable read per statement is all this costs when nothing is profiled
+    if _active.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    started = getattr(context, '_profile_started', None)
+    if profile is not None and started is not None:
+        profile.statements.append({
+            'statement': statement[:MAX_STATEMENT_CHARS],
+            'ms': (time.perf_counter() - started) * 1000,
+            'rows': cursor.rowcount,
+            'database': os.path.basename(conn.engine.url.database or '') or conn.engine.url.host,
+            'executemany': executemany,
+        })
+
+
+# ----------------------------
+# Request profiles
+# ----------------------------
+class RequestProfile:
+    """Stack samples, SQL statements and timings for the request running on this thread."""
+
+    def __init__(self, interval, root_path):
+        self.statements = []
+        self.sampler = StackSampler(threading.get_ident(), interval, root_path)
+        self.interval = interval
+        self.duration_ms = self.cpu_ms = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+        _active.set(self)
+        self.sampler.start()
+
+    def stop(self):
+        if self.duration_ms is not None:
+            return
+        _active.set(None)
+        self.sampler.stop()
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu_started) * 1000
+
+    def report(self):
+        by_statement = {}
+        for item in self.statements:
+            totals = by_statement.setdefault(item['statement'], {'statement': item['statement'], 'count': 0, 'ms': 0.0})
+            totals['count'] += 1
+            totals['ms'] += item['ms']
+        return {
+            'interval': self.interval,
+            'call_tree': build_call_tree(self.sampler.stacks),
+            'collapsed': collapsed_stacks(self.sampler.stacks),
+            'statements': self.statements,
+            'statement_totals': sorted(by_statement.values(), key=lambda totals: totals['ms'], reverse=True),
+        }
+
+
+def save_profile(profile, response, keep):
+    """Store the report on its own connection, outside the request's session, and prune old ones."""
+    with db.engine.begin() as connection:
+        report_id = connection.execute(insert(ProfileReport).values(
+            method=request.method,
+            path=request.full_path.rstrip('?')[:500],
+            endpoint=request.endpoint,
+            status_code=response.status_code,
+            duration_ms=profile.duration_ms,
+            cpu_ms=profile.cpu_ms,
+            sql_count=len(profile.statements),
+            sql_ms=sum(item['ms'] for item in profile.statements),
+            samples=sum(profile.sampler.stacks.values()),
+            report=json.dumps(profile.report()),
+        )).inserted_primary_key[0]
+        cutoff = connection.execute(
+            select(ProfileReport.id).order_by(ProfileReport.id.desc()).offset(keep).limit(1)
+        ).scalar()
+        if cutoff is not None:
+            connection.execute(delete(ProfileReport).where(ProfileReport.id <= cutoff))
+    return report_id
+
+
+def get_profile_report(report_id):
+    """The stored row and its decoded report, or (None, None)."""
+    row = db.session.get(ProfileReport, report_id)
+    return (row, json.loads(row.report)) if row else (None, None)
+
+
+def _profile_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+
+
+def init_profiling(app):
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    @app.before_request
+    def start_profile():
+        # Checked in this order so unprofiled requests never load the session for it
+        if not _profile_requested() or not session.get('is_admin_logged_in'):
+            return
+        g.profile = RequestProfile(app.config['PROFILE_SAMPLE_INTERVAL'], app.root_path)
+        g.profile.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        # Streamed bodies are produced after this point and are not covered
+        profile.stop()
+        report_id = save_profile(profile, response, app.config['PROFILE_KEEP'])
+        response.headers['X-Profile-Id'] = str(report_id)
+        log_event('request_profiled', report_id=report_id, path=request.path,
+                  duration_ms=round(profile.duration_ms, 1), sql_count=len(profile.statements))
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # The request failed before after_request; stop sampling without a report
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile.stop()
@@ -0,0 +1,120 @@
+import threading
+from datetime import datetime
+
+import click
+from sqlalchemy import delete, select
+from models import db, User, ParkingLot, ParkingSpot, Reservation, ArchivedReservation, UserStats, EmailJob
+from sharding import shard_keys, shard_session, session_for_lot
+from catalog import bump_catalog_version, spot_grid_catalog
+from user import cancel_before_delete
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _delete_in_batches(session, model, condition, batch_size, before_delete=None):
+    """Delete rows matching `condition` a batch at a time, committing after each.
+
+    `before_delete(session, ids)`, if given, runs on each batch's ids first.
+    """
+    removed = 0
+    while True:
+        ids = session.execute(select(model.id).where(condition).limit(batch_size)).scalars().all()
+        if not ids:
+            return removed
+        if before_delete is not None:
+            before_delete(session, ids)
+        result = session.execute(
+            delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        session.commit()
+        removed += result.rowcount
+
+
+def _cancel_live(session, reservation_ids):
+    cancel_before_delete(session, reservation_ids, datetime.now())
+
+
+def purge_deleted_lot(lot_id, batch_size):
+    # Spots and bookings live in the lot's shard, next to a mirror of the lot row
+    session = session_for_lot(lot_id)
+    spot_ids = select(ParkingSpot.id).where(ParkingSpot.lot_id == lot_id)
+    removed = _delete_in_batches(session, Reservation, Reservation.spot_id.in_(spot_ids), batch_size, _cancel_live)
+    removed += _delete_in_batches(session, ParkingSpot, ParkingSpot.lot_id == lot_id, batch_size)
+    # Core deletes bypass the session listeners that keep spot grids current
+    bump_catalog_version(spot_grid_catalog(lot_id))
+    if session is not db.session:
+        session.execute(delete(ParkingLot).where(ParkingLot.id == lot_id))
+        session.commit()
+    db.session.execute(delete(ParkingLot).where(ParkingLot.id == lot_id))
+    db.session.commit()
+    return removed
+
+
+def purge_deleted_user(user_id, batch_size):
+    removed = 0
+    for key in shard_keys():
+        session = shard_session(key)
+        # Closed first too, or their spots would stay occupied
+        removed += _delete_in_batches(session, Reservation, Reservation.user_id == user_id, batch_size, _cancel_live)
+        removed += _delete_in_batches(session, ArchivedReservation, ArchivedReservation.user_id == user_id, batch_size)
+    email = db.session.query(User.email).filter(User.id == user_id).scalar()
+    if email:
+        db.session.execute(delete(EmailJob).where(EmailJob.recipient == email))
+    db.session.execute(delete(UserStats).where(UserStats.user_id == user_id))
+    db.session.execute(delete(User).where(User.id == user_id))
+    db.session.commit()
+    return removed
+
+
+def purge_soft_deleted(batch_size=5000):
+    """Remove soft-deleted lots and users, children first, in bounded batches.
+
+    Every batch is its own short transaction, so bookings elsewhere are never
+    blocked behind one huge cascading DELETE. Returns the child rows removed.
+    """
+    removed = 0
+    lot_ids = [row.id for row in db.session.query(ParkingLot.id).filter(ParkingLot.deleted_at.isnot(None))]
+    for lot_id in lot_ids:
+        removed += purge_deleted_lot(lot_id, batch_size)
+    user_ids = [row.id for row in db.session.query(User.id).filter(User.deleted_at.isnot(None))]
+    for user_id in user_ids:
+        removed += purge_deleted_user(user_id, batch_size)
+    return removed
+
+
+def has_pending_purge():
+    return db.session.query(ParkingLot.id).filter(ParkingLot.deleted_at.isnot(None)).first() is not None \
+        or db.session.query(User.id).filter(User.deleted_at.isnot(None)).first() is not None
+
+
+def start_purge_worker(app):
+    """Run purge_soft_deleted on a background thread unless one is already running."""
+    global _worker
+
+    def run():
+        with app.app_context():
+            try:
+                # Loop so rows soft-deleted while a pass was running are not left behind
+                while has_pending_purge():
+                    purge_soft_deleted(app.config['PURGE_BATCH_SIZE'])
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("Background purge failed; it will be retried on the next delete")
+            finally:
+                db.session.remove()
+
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=run, name='soft-delete-purge', daemon=True)
+        _worker.start()
+
+
+def init_purge(app):
+    @app.cli.command('purge-deleted')
+    @click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+    def purge_deleted_command(batch_size):
+        """Remove soft-deleted lots and users with their bookings."""
+        removed = purge_soft_deleted(batch_size or app.config['PURGE_BATCH_SIZE'])
+        click.echo(f"Purged {removed} dependent rows")
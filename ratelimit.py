@@ -0,0 +1,181 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import logging
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+# Idle bucket rows are pruned at most this often per process, and only once they have
+# been idle this long (or longer, if a bucket takes longer than that to refill)
+PRUNE_INTERVAL = 60.0
+PRUNE_IDLE_SECONDS = 3600.0
+
+
+class SharedLimiter:
+    """Token buckets and in-flight counters stored in a local SQLite file.
+
+    Every gunicorn worker on the host opens the same file, so limits apply to
+    the whole server rather than per process. Each check is a single short
+    BEGIN IMMEDIATE transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bucket '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS inflight '
+                '(id INTEGER PRIMARY KEY, endpoint TEXT NOT NULL, started REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_inflight_endpoint ON inflight (endpoint)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_bucket_updated ON bucket (updated)')
+            self._local.conn = conn
+        return conn
+
+    def take_token(self, key, rate, burst):
+        """Consume one token from `key`'s bucket.
+
+        Returns 0 when allowed, otherwise the seconds until a token is available.
+        `rate` must be positive. Raises sqlite3.OperationalError if the limiter
+        file stays locked.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if time.monotonic() >= self._next_prune:
+                # A bucket idle long enough to refill is the same as no row at all
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+                idle = max(PRUNE_IDLE_SECONDS, burst / rate)
+                conn.execute('DELETE FROM bucket WHERE updated < ?', (now - idle,))
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire_slot(self, endpoint, limit, stale_after=30.0):
+        """Claim one of `limit` concurrent slots for `endpoint`, or return None.
+
+        Raises sqlite3.OperationalError if the limiter file stays locked.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Slots left behind by a killed worker expire instead of leaking
+            conn.execute('DELETE FROM inflight WHERE started < ?', (now - stale_after,))
+            in_use = conn.execute('SELECT COUNT(*) FROM inflight WHERE endpoint = ?', (endpoint,)).fetchone()[0]
+            slot = None
+            if in_use < limit:
+                slot = conn.execute(
+                    'INSERT INTO inflight (endpoint, started) VALUES (?, ?)', (endpoint, now)
+                ).lastrowid
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return slot
+
+    def release_slot(self, slot):
+        self._connect().execute('DELETE FROM inflight WHERE id = ?', (slot,))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter():
+    path = current_app.config['RATE_LIMIT_DB']
+    with _limiters_lock:
+        if path not in _limiters:
+            _limiters[path] = SharedLimiter(path)
+        return _limiters[path]
+
+
+def _too_many_requests(retry_after):
+    response = jsonify({'error': 'Too many requests, please slow down.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def rate_limited(config_prefix):
+    """Apply a per-user token bucket and a server-wide concurrency cap to a view.
+
+    Limits are read from `<config_prefix>_RATE`, `_BURST`, `_MAX_CONCURRENT`
+    and `_QUEUE_TIMEOUT` in the app config; a rate of 0 turns the per-user
+    bucket off and leaves only the cap. Requests over either limit get a
+    429 straight away (or after at most the queue timeout for the cap). A
+    limiter file too busy to answer means the server is overloaded, so those
+    requests are shed with a 429 as well rather than failing with a 500.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            config = current_app.config
+            if not config.get('RATE_LIMIT_ENABLED', True):
+                return f(*args, **kwargs)
+
+            limiter = get_limiter()
+            endpoint = request.endpoint
+            who = current_user.get_id() if current_user.is_authenticated else request.remote_addr
+            rate = config[f'{config_prefix}_RATE']
+            try:
+                if rate > 0:
+                    wait = limiter.take_token(f"{endpoint}:{who}", rate, config[f'{config_prefix}_BURST'])
+                    if wait:
+                        return _too_many_requests(wait)
+
+                # Retry the cap with exponential backoff so queued requests add little write traffic
+                deadline = time.monotonic() + config[f'{config_prefix}_QUEUE_TIMEOUT']
+                delay = 0.01
+                while True:
+                    slot = limiter.acquire_slot(endpoint, config[f'{config_prefix}_MAX_CONCURRENT'])
+                    if slot is not None:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return _too_many_requests(1)
+                    time.sleep(min(delay, remaining))
+                    delay *= 2
+            except sqlite3.OperationalError as e:
+                logger.warning("Rate limiter busy, shedding %s: %s", endpoint, e)
+                return _too_many_requests(1)
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                try:
+                    limiter.release_slot(slot)
+                except sqlite3.OperationalError as e:
+                    # The slot expires after stale_after seconds instead
+                    logger.warning("Could not release rate limiter slot %s: %s", slot, e)
+        return decorated_function
+    return decorator
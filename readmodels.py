@@ -0,0 +1,120 @@
+import heapq
+from datetime import datetime
+from operator import attrgetter
+
+from sqlalchemy import select, literal
+from models import ParkingLot, ParkingSpot, Reservation, ArchivedReservation, LIVE_STATUSES
+from sharding import fan_out, shard_keys, shard_session
+
+
+class BookingRow:
+    """Flat, read-only view of one booking for list pages.
+
+    Built from a single joined SELECT, so rendering never touches the ORM
+    relationships (Reservation.spot -> ParkingSpot.lot) row by row.
+    """
+
+    __slots__ = (
+        'id', 'spot_id', 'spot_number', 'user_id', 'lot_name', 'parking_timestamp', 'leaving_timestamp',
+        'parking_cost', 'rating', 'feedback', 'status', 'is_archived',
+    )
+
+    def __init__(self, id, spot_id, spot_number, user_id, lot_name, parking_timestamp, leaving_timestamp,
+                 parking_cost, rating, feedback, status, is_archived):
+        self.id = id
+        self.spot_id = spot_id
+        self.spot_number = spot_number
+        self.user_id = user_id
+        self.lot_name = lot_name
+        self.parking_timestamp = parking_timestamp
+        self.leaving_timestamp = leaving_timestamp
+        self.parking_cost = parking_cost
+        self.rating = rating
+        self.feedback = feedback
+        self.status = status
+        self.is_archived = is_archived
+
+
+def _booking_select(model):
+    return (
+        select(
+            model.id, model.spot_id, ParkingSpot.number, model.user_id, ParkingLot.prime_location_name,
+            model.parking_timestamp, model.leaving_timestamp, model.parking_cost,
+            model.rating, model.feedback, model.status, literal(model is ArchivedReservation)
+        )
+        .outerjoin(ParkingSpot, ParkingSpot.id == model.spot_id)
+        .outerjoin(ParkingLot, ParkingLot.id == ParkingSpot.lot_id)
+    )
+
+
+def _rows(statement, order_by, descending=False, limit=None):
+    """Run the statement on every shard and merge the already-sorted results."""
+    per_shard = fan_out(lambda session: [BookingRow(*row) for row in session.execute(statement)])
+    if len(per_shard) == 1:
+        return per_shard[0]
+    rows = heapq.merge(*per_shard, key=attrgetter(order_by), reverse=descending)
+    return list(rows)[:limit] if limit else list(rows)
+
+
+def get_active_booking_rows(user_id, now):
+    """Today's live bookings for a user that have not ended yet, soonest first."""
+    start_of_day = datetime.combine(now.date(), datetime.min.time())
+    return _rows(
+        _booking_select(Reservation)
+        .where(
+            Reservation.user_id == user_id,
+            Reservation.live(),
+            Reservation.parking_timestamp >= start_of_day,
+            Reservation.leaving_timestamp >= now
+        )
+        .order_by(Reservation.parking_timestamp.asc()),
+        'parking_timestamp'
+    )
+
+
+def get_past_booking_rows(user_id):
+    """Completed and cancelled bookings for a user, newest first, including archived ones."""
+    live = _rows(
+        _booking_select(Reservation)
+        .where(Reservation.user_id == user_id, Reservation.status.notin_(LIVE_STATUSES))
+        .order_by(Reservation.leaving_timestamp.desc()),
+        'leaving_timestamp', descending=True
+    )
+    archived = _rows(
+        _booking_select(ArchivedReservation)
+        .where(ArchivedReservation.user_id == user_id)
+        .order_by(ArchivedReservation.leaving_timestamp.desc()),
+        'leaving_timestamp', descending=True
+    )
+    # Archived rows are all older than the live ones, so appending keeps the order
+    return live + archived
+
+
+def get_recent_booking_rows(user_id=None, limit=5):
+    """Most recently started bookings, optionally for one user."""
+    statement = _booking_select(Reservation)
+    if user_id is not None:
+        statement = statement.where(Reservation.user_id == user_id)
+    return _rows(
+        statement.order_by(Reservation.parking_timestamp.desc()).limit(limit),
+        'parking_timestamp', descending=True, limit=limit
+    )
+
+
+def iter_booking_history_rows(user_id, chunk_size=500):
+    """Yield every booking a user has made, live then archived, streaming in chunks.
+
+    Shards are read side by side and merged, so the output stays newest first.
+    """
+    for model in (Reservation, ArchivedReservation):
+        statement = (
+            _booking_select(model)
+            .where(model.user_id == user_id)
+            .order_by(model.parking_timestamp.desc())
+            .execution_options(yield_per=chunk_size)
+        )
+        streams = [
+            (BookingRow(*row) for row in shard_session(key).execute(statement))
+            for key in shard_keys()
+        ]
+        yield from heapq.merge(*streams, key=attrgetter('parking_timestamp'), reverse=True)
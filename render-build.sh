@@ -5,5 +5,8 @@ set -o errexit
 # Install dependencies
 pip install -r requirements.txt
 
+# Fingerprint and precompress static assets
+flask build-assets
+
 # Run migrations
 flask db upgrade
@@ -0,0 +1,249 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from sqlalchemy import MetaData, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from models import db, ParkingLot, ParkingSpot
+from config import Config
+
+# Spot and reservation ids in shard N start at N * SHARD_ID_STRIDE, so any id names its shard
+SHARD_ID_STRIDE = 100_000_000
+
+# Tables that live in a shard; parking_lot rows there are mirrors of the main database's
+SHARD_TABLES = ('parking_lot', 'parking_spot', 'reservation', 'archived_reservation')
+ID_RANGE_TABLES = ('parking_spot', 'reservation')
+
+_executor = None
+_lock = threading.Lock()
+_lot_shards = {}
+
+
+# ----------------------------
+# Routing
+# ----------------------------
+def sharding_enabled():
+    return bool(current_app.config.get('SHARDS'))
+
+
+def shard_keys():
+    """Bind key of every shard, the main database (None) first."""
+    return [None] + [f'shard{i}' for i in range(1, len(current_app.config.get('SHARDS', ())) + 1)]
+
+
+def shard_for_pin(pin_code):
+    """Bind key whose longest configured prefix matches the pin code; None for the main database."""
+    key, matched = None, 0
+    for i, (prefixes, _) in enumerate(current_app.config.get('SHARDS', ()), start=1):
+        for prefix in prefixes:
+            if len(prefix) > matched and (pin_code or '').startswith(prefix):
+                key, matched = f'shard{i}', len(prefix)
+    return key
+
+
+def shard_for_lot_id(lot_id):
+    # A lot never changes shard (edit_lot refuses), so the answer is cached for good
+    if not sharding_enabled():
+        return None
+    if lot_id not in _lot_shards:
+        pin_code = db.session.query(ParkingLot.pin_code).filter_by(id=lot_id).scalar()
+        if pin_code is None:
+            # No such lot yet; caching that would misroute it once it is added
+            return None
+        _lot_shards[lot_id] = shard_for_pin(pin_code)
+    return _lot_shards[lot_id]
+
+
+def shard_for_id(row_id):
+    """Bind key holding a spot or reservation id."""
+    try:
+        index = int(row_id) // SHARD_ID_STRIDE
+    except (TypeError, ValueError):
+        return None
+    return f'shard{index}' if index else None
+
+
+def shard_session(key=None):
+    """Session for a bind key; the main database's is db.session itself."""
+    if key is None:
+        return db.session
+    registry = current_app.extensions['shard_sessions']
+    with _lock:
+        if key not in registry:
+            registry[key] = scoped_session(sessionmaker(bind=db.engines[key], info={'shard': key}))
+    return registry[key]()
+
+
+def session_for_lot(lot_id):
+    return shard_session(shard_for_lot_id(lot_id))
+
+
+def session_for_id(row_id):
+    return shard_session(shard_for_id(row_id))
+
+
+def commit_shard(session):
+    """Commit a shard session; db.session is left to the caller.
+
+    With sharding off the session is db.session and the caller's single
+    commit covers everything, as before.
+    """
+    if session is not db.session:
+        session.commit()
+
+
+def rollback_shard(session):
+    if session is not db.session:
+        session.rollback()
+
+
+# ----------------------------
+# Fan-out
+# ----------------------------
+def fan_out(fn, keys=None):
+    """Call fn(session) on each shard and return the results in shard order.
+
+    Shards are queried in parallel, each worker in its own app context and
+    sessions. A single shard (sharding off) runs inline on db.session.
+    """
+    keys = shard_keys() if keys is None else list(keys)
+    if len(keys) == 1:
+        return [fn(shard_session(keys[0]))]
+
+    app = current_app._get_current_object()
+    # Workers see a copy of the caller's context variables, such as an active request profile
+    contexts = [contextvars.copy_context() for _ in keys]
+
+    def run(key):
+        with app.app_context():
+            return fn(shard_session(key))
+
+    return list(_get_executor().map(lambda context, key: context.run(run, key), contexts, keys))
+
+
+def fan_out_lots(fn, lot_ids):
+    """Call fn(session, lot_ids) once per shard with the ids of the lots stored there."""
+    groups = {}
+    for lot_id in lot_ids:
+        groups.setdefault(shard_for_lot_id(lot_id), []).append(lot_id)
+    if not groups:
+        return []
+    return fan_out(lambda session: fn(session, groups[session.info.get('shard')]), groups)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.SHARD_FANOUT_WORKERS, thread_name_prefix='shard')
+    return _executor
+
+
+# ----------------------------
+# Lot mirrors
+# ----------------------------
+def mirror_lot(lot):
+    """Copy a lot's current row into its shard so joins and cascades there see it."""
+    key = shard_for_pin(lot.pin_code)
+    _lot_shards[lot.id] = key
+    session = shard_session(key)
+    if session is db.session:
+        return
+    session.merge(ParkingLot(**{column.key: getattr(lot, column.key) for column in ParkingLot.__table__.columns}))
+    session.commit()
+
+
+def remove_lot_mirror(lot):
+    session = shard_session(shard_for_pin(lot.pin_code))
+    if session is db.session:
+        return
+    # Spots and their reservations follow through ON DELETE CASCADE
+    session.query(ParkingLot).filter_by(id=lot.id).delete(synchronize_session=False)
+    session.commit()
+
+
+# ----------------------------
+# Shard schema
+# ----------------------------
+def shard_metadata():
+    """The shard tables, minus foreign keys to tables that stay in the main database."""
+    metadata = MetaData()
+    for name in SHARD_TABLES:
+        table = db.metadata.tables[name].to_metadata(metadata)
+        if name in ID_RANGE_TABLES:
+            # SQLite only honours a starting id through sqlite_sequence
+            table.dialect_kwargs['sqlite_autoincrement'] = True
+    for table in metadata.tables.values():
+        for constraint in list(table.foreign_key_constraints):
+            if constraint.elements[0].target_fullname.split('.')[0] in metadata.tables:
+                continue
+            table.constraints.discard(constraint)
+            for foreign_key in constraint.elements:
+                foreign_key.parent.foreign_keys.discard(foreign_key)
+                table.foreign_keys.discard(foreign_key)
+    return metadata
+
+
+def reserve_id_range(connection, table, start):
+    """Make the next id generated in `table` at least `start`."""
+    current = connection.execute(text(f'SELECT COALESCE(MAX(id), 0) FROM {table}')).scalar()
+    if current >= start:
+        return
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        connection.execute(text('DELETE FROM sqlite_sequence WHERE name = :name'), {'name': table})
+        connection.execute(
+            text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)'),
+            {'name': table, 'seq': start - 1}
+        )
+    elif dialect == 'postgresql':
+        connection.execute(
+            text("SELECT setval(pg_get_serial_sequence(:name, 'id'), :start, false)"),
+            {'name': table, 'start': start}
+        )
+    else:
+        raise click.ClickException(f"Cannot reserve an id range on {dialect}")
+
+
+def init_shards():
+    """Create missing shard tables, reserve id ranges and mirror lots into their shards."""
+    conflicting = [
+        lot.prime_location_name
+        for lot in ParkingLot.query.order_by(ParkingLot.id)
+        if shard_for_pin(lot.pin_code) is not None
+        and db.session.query(ParkingSpot.id).filter_by(lot_id=lot.id).first() is not None
+    ]
+    if conflicting:
+        # Existing spots and bookings are not moved between databases
+        raise click.ClickException(
+            "These lots already have spots in the main database: " + ", ".join(conflicting)
+        )
+
+    for index, key in enumerate(shard_keys()[1:], start=1):
+        engine = db.engines[key]
+        shard_metadata().create_all(engine)
+        with engine.begin() as connection:
+            for table in ID_RANGE_TABLES:
+                reserve_id_range(connection, table, index * SHARD_ID_STRIDE)
+
+    for lot in ParkingLot.query.order_by(ParkingLot.id):
+        mirror_lot(lot)
+
+
+def init_sharding(app):
+    app.extensions['shard_sessions'] = {}
+
+    @app.teardown_appcontext
+    def remove_shard_sessions(exc):
+        for registry in app.extensions['shard_sessions'].values():
+            registry.remove()
+
+    @app.cli.command('init-shards')
+    def init_shards_command():
+        """Create the regional shard tables and copy each lot into its shard."""
+        if not app.config.get('SHARDS'):
+            raise click.ClickException("No shards configured; set SHARD_DATABASES")
+        init_shards()
+        click.echo(f"Initialised {len(app.config['SHARDS'])} shards")
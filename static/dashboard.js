@@ -13,7 +13,14 @@ document.addEventListener('DOMContentLoaded', function() {
   const noSpotsMessage = document.getElementById('no-spots-message');
 
   // When start or end time changes, fetch available spots for the selected lot and time window
+  let fetchTimer = null;
   function fetchAvailableSpots(lot) {
+    // Debounce so rapid edits to the time inputs send a single search
+    clearTimeout(fetchTimer);
+    fetchTimer = setTimeout(() => doFetchAvailableSpots(lot), 300);
+  }
+
+  function doFetchAvailableSpots(lot) {
     const startTime = startTimeInput.value;
     const endTime = endTimeInput.value;
     if (!startTime || !endTime) return;
@@ -25,8 +32,10 @@ document.addEventListener('DOMContentLoaded', function() {
       method: 'POST',
       body: formData
     })
-    .then(res => res.json())
+    .then(res => res.status === 429 ? null : res.json())
     .then(results => {
+      // Rate limited: keep the current list, the next change will retry
+      if (!results) return;
       const lotResult = results.find(l => l.id === lot.id);
       spotSelect.innerHTML = '';
       if (!lotResult || lotResult.spots.length === 0) {
@@ -45,9 +54,19 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   }
 
+  // A full lot offers its waitlist for the chosen window instead
+  const waitlistForm = document.getElementById('waitlist-form');
+  if (waitlistForm) {
+    waitlistForm.addEventListener('submit', function() {
+      document.getElementById('waitlist-start-time').value = startTimeInput.value;
+      document.getElementById('waitlist-end-time').value = endTimeInput.value;
+    });
+  }
+
   // Patch openBookingModal to use AJAX spot fetching
   window.openBookingModal = function(lot, spotId) {
     window.currentLotRate = lot.rate;
+    document.getElementById('waitlist-lot-id').value = lot.id;
     ratePerHourEl.textContent = lot.rate;
     totalPriceEl.textContent = 0;
     startTimeInput.value = '';
@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# Config is read when app is imported, so point it at a throwaway database first
+_db_dir = tempfile.mkdtemp(prefix='parkease-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ['SHARD_DATABASES'] = ''
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+os.environ['MAIL_WORKER_ENABLED'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, ParkingLot, ParkingSpot  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.create_all(bind_key=None)
+        yield flask_app
+        db.session.remove()
+        db.drop_all(bind_key=None)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Sign the test client in as a user, the admin, or both, without the login forms."""
+    def login(user=None, admin=False):
+        with client.session_transaction() as session:
+            if user is not None:
+                session['_user_id'] = str(user.id)
+                session['_fresh'] = True
+            if admin:
+                session['is_admin_logged_in'] = True
+    return login
+
+
+@pytest.fixture
+def make_user(app):
+    def make(username, email=None):
+        user = User(username=username, password='x', email=email or f'{username}@example.test')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def lot_with_spot(app):
+    """A one-spot lot: the simplest lot that can be full."""
+    lot = ParkingLot(prime_location_name='Central', price=40, address='1 Main St',
+                     pin_code='400001', maximum_number_of_spots=1)
+    db.session.add(lot)
+    db.session.flush()
+    spot = ParkingSpot(lot_id=lot.id, number=1)
+    db.session.add(spot)
+    db.session.commit()
+    return lot, spot
+
+
+@pytest.fixture
+def today():
+    """Midday today, so windows either side of it stay on the same date."""
+    return datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import sweep_hourly_occupancy, summarize_occupancy
+from models import db, ArchivedReservation, Reservation, BOOKED, COMPLETED, CANCELLED
+from user import close_reservation
+
+DAY = datetime(2026, 3, 2)
+
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+
+@pytest.fixture
+def add_booking(lot_with_spot, make_user):
+    _, spot = lot_with_spot
+    user = make_user('driver')
+
+    def add(start, end, status=COMPLETED, archived=False):
+        model = ArchivedReservation if archived else Reservation
+        values = dict(spot_id=spot.id, user_id=user.id, parking_timestamp=start, leaving_timestamp=end, status=status)
+        if archived:
+            values['id'] = 10_000 + ArchivedReservation.query.count()
+        row = model(**values)
+        db.session.add(row)
+        db.session.commit()
+        return row
+    return add
+
+
+def test_overlapping_bookings_peak_together(app, lot_with_spot, add_booking):
+    lot, _ = lot_with_spot
+    add_booking(at(9), at(11))
+    add_booking(at(9, 30), at(10, 30))
+    add_booking(at(10, 45), at(12), archived=True)
+
+    grid = sweep_hourly_occupancy(DAY, DAY + timedelta(days=1))[lot.id]
+    assert grid[8:13] == [0, 2, 2, 1, 0]
+    assert len(grid) == 24
+
+
+def test_back_to_back_bookings_do_not_overlap(app, lot_with_spot, add_booking):
+    lot, _ = lot_with_spot
+    add_booking(at(9), at(10))
+    add_booking(at(10), at(11))
+    grid = sweep_hourly_occupancy(DAY, DAY + timedelta(days=1))[lot.id]
+    # Ending exactly at 10:00 does not reach into the 10 o'clock hour
+    assert grid[8:12] == [0, 1, 1, 0]
+
+
+def test_cancelled_booking_counts_while_the_car_was_there(app, lot_with_spot, add_booking):
+    lot, _ = lot_with_spot
+    add_booking(at(9), at(10, 30), status=CANCELLED)
+    grid = sweep_hourly_occupancy(DAY, DAY + timedelta(days=1))[lot.id]
+    assert grid[8:12] == [0, 1, 1, 0]
+
+
+def test_booking_cancelled_before_it_started_is_skipped(app, lot_with_spot, add_booking):
+    lot, _ = lot_with_spot
+    booking = add_booking(at(14), at(16), status=BOOKED)
+    close_reservation(booking, CANCELLED, at(9))
+    db.session.commit()
+
+    assert booking.leaving_timestamp == booking.parking_timestamp
+    # Rows written before the clamp, ending before they start, are skipped too
+    add_booking(at(15), at(13), status=CANCELLED)
+    assert lot.id not in sweep_hourly_occupancy(DAY, DAY + timedelta(days=1))
+
+
+def test_bookings_are_clipped_to_the_range(app, lot_with_spot, add_booking):
+    lot, _ = lot_with_spot
+    add_booking(at(-2), at(1))
+    add_booking(at(23), at(26))
+    grid = sweep_hourly_occupancy(DAY, DAY + timedelta(days=1))[lot.id]
+    assert grid[0] == 1 and grid[1] == 0 and grid[23] == 1
+
+
+def test_summary_keeps_each_hours_highest_peak_and_the_first_peak_time():
+    day = DAY.date()
+    daily = {day: {1: [0] * 9 + [2, 3] + [0] * 13}, day + timedelta(days=1): {1: [0] * 9 + [4] + [0] * 14}}
+    profile, peak = summarize_occupancy(daily)
+    assert profile[1][9:11] == [4, 3]
+    assert peak[1] == (4, DAY + timedelta(days=1, hours=9))
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import archive_closed_reservations, get_archived_revenue
+from models import db, ArchivedReservation, Reservation, BOOKED, ACTIVE, COMPLETED, CANCELLED
+from userstats import compute_user_stats
+
+
+@pytest.fixture
+def history(lot_with_spot, make_user):
+    """Closed bookings from last month, plus old ones still live and a recent closed one."""
+    _, spot = lot_with_spot
+    user = make_user('driver')
+    now = datetime.now()
+    old = now - timedelta(days=40)
+
+    def add(start, status, cost=40):
+        reservation = Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=start,
+                                  leaving_timestamp=start + timedelta(hours=1), parking_cost=cost,
+                                  rating=4, feedback='Fine', status=status)
+        db.session.add(reservation)
+        return reservation
+
+    rows = {
+        'completed': [add(old + timedelta(hours=i), COMPLETED) for i in range(3)],
+        'cancelled': [add(old + timedelta(hours=5), CANCELLED, cost=0)],
+        # Never closed by the expiry sweep; not ours to archive
+        'live': [add(old + timedelta(hours=6), BOOKED), add(old + timedelta(hours=7), ACTIVE)],
+        'recent': [add(now - timedelta(days=1), COMPLETED)],
+    }
+    db.session.commit()
+    return user, {name: [reservation.id for reservation in group] for name, group in rows.items()}
+
+
+def test_closed_bookings_past_the_horizon_move_in_batches(app, history):
+    user, ids = history
+    before_stats = compute_user_stats(user.id)
+
+    moved = archive_closed_reservations(datetime.now() - timedelta(days=30), batch_size=2)
+
+    assert moved == 4
+    assert sorted(row.id for row in ArchivedReservation.query) == sorted(ids['completed'] + ids['cancelled'])
+    assert sorted(row.id for row in Reservation.query) == sorted(ids['live'] + ids['recent'])
+    archived = db.session.get(ArchivedReservation, ids['completed'][0])
+    assert (archived.rating, archived.feedback, archived.status) == (4, 'Fine', COMPLETED)
+    assert db.session.get(ArchivedReservation, ids['cancelled'][0]).status == CANCELLED
+    assert get_archived_revenue() == 120
+    # Totals span both tables, so moving rows changes nothing the user sees
+    after_stats = compute_user_stats(user.id)
+    assert (after_stats.total_bookings, after_stats.active_bookings, after_stats.total_spent) == \
+        (before_stats.total_bookings, before_stats.active_bookings, before_stats.total_spent)
+
+
+def test_archiving_again_moves_nothing(app, history):
+    before = datetime.now() - timedelta(days=30)
+    archive_closed_reservations(before)
+    assert archive_closed_reservations(before) == 0
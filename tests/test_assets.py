@@ -0,0 +1,68 @@
+import gzip
+import os
+
+import pytest
+from flask import Flask, url_for
+
+from assets import build_assets, init_assets, load_manifest
+
+
+@pytest.fixture
+def static_folder(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'css' / 'admin.css').write_text('body { color: #333; }\n' * 50)
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG not really')
+    return tmp_path
+
+
+def test_build_names_files_by_content_and_compresses_text(static_folder):
+    manifest = build_assets(str(static_folder))
+
+    css = manifest['css/admin.css']
+    assert css.startswith('build/css/admin.') and css.endswith('.css')
+    with gzip.open(static_folder / (css + '.gz')) as f:
+        assert f.read() == (static_folder / 'css' / 'admin.css').read_bytes()
+    # Binary files are copied but not compressed
+    assert not os.path.exists(static_folder / (manifest['logo.png'] + '.gz'))
+    assert load_manifest(str(static_folder)) == manifest
+
+
+def test_rebuild_skips_the_build_directory_and_follows_content(static_folder):
+    first = build_assets(str(static_folder))
+    assert build_assets(str(static_folder)) == first
+
+    (static_folder / 'css' / 'admin.css').write_text('body { color: #000; }\n')
+    second = build_assets(str(static_folder))
+    assert second['css/admin.css'] != first['css/admin.css']
+    assert second['logo.png'] == first['logo.png']
+
+
+def test_missing_manifest_leaves_static_urls_alone(static_folder):
+    assert load_manifest(str(static_folder)) == {}
+
+
+@pytest.fixture
+def asset_app(static_folder):
+    manifest = build_assets(str(static_folder))
+    asset_app = Flask(__name__, static_folder=str(static_folder), static_url_path='/static')
+    init_assets(asset_app)
+    return asset_app, manifest
+
+
+def test_static_urls_point_at_fingerprinted_files(asset_app):
+    asset_app, manifest = asset_app
+    with asset_app.test_request_context():
+        assert url_for('static', filename='css/admin.css') == '/static/' + manifest['css/admin.css']
+        assert url_for('static', filename='unknown.js') == '/static/unknown.js'
+
+
+@pytest.mark.parametrize('accept, encoding', [('gzip, deflate', 'gzip'), ('identity', None)])
+def test_fingerprinted_files_are_served_precompressed_and_immutable(asset_app, accept, encoding):
+    asset_app, manifest = asset_app
+    response = asset_app.test_client().get('/static/' + manifest['css/admin.css'], headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == encoding
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    response.close()
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import update
+
+import catalog
+from catalog import LOT_CATALOG, bump_catalog_version, get_catalog_version, get_lot_catalog, search_lot_catalog, \
+    spot_grid_catalog
+from models import db, ParkingLot, ParkingSpot
+
+
+@pytest.fixture(autouse=True)
+def empty_catalog(monkeypatch):
+    # Each test starts a fresh database whose versions count from zero again
+    monkeypatch.setattr(catalog, '_cached_version', None)
+    monkeypatch.setattr(catalog, '_cached_lots', ())
+
+
+def versions(lot):
+    return get_catalog_version(LOT_CATALOG), get_catalog_version(spot_grid_catalog(lot.id))
+
+
+def test_lot_and_spot_changes_bump_the_versions_they_affect(app, lot_with_spot):
+    lot, spot = lot_with_spot
+    lots, spots = versions(lot)
+
+    lot.price = 50
+    db.session.commit()
+    assert versions(lot) == (lots + 1, spots)
+
+    # A booking changes the grid but not the catalogue's spot counts
+    spot.status = 'O'
+    db.session.commit()
+    assert versions(lot) == (lots + 1, spots + 1)
+
+    db.session.add(ParkingSpot(lot_id=lot.id, number=2))
+    db.session.commit()
+    assert versions(lot) == (lots + 2, spots + 2)
+
+
+def test_unchanged_and_rolled_back_writes_do_not_bump(app, lot_with_spot):
+    lot, spot = lot_with_spot
+    before = versions(lot)
+
+    lot.price = lot.price
+    db.session.commit()
+    lot.price = 99
+    db.session.flush()
+    db.session.rollback()
+    assert versions(lot) == before
+
+
+def test_catalog_reloads_only_when_the_version_moves(app, lot_with_spot):
+    lot, _ = lot_with_spot
+    assert [(record.prime_location_name, record.spot_count) for record in get_lot_catalog()] == [('Central', 1)]
+
+    # A write outside the ORM goes unseen until the version is bumped for it
+    with db.engine.begin() as connection:
+        connection.execute(update(ParkingLot).where(ParkingLot.id == lot.id).values(prime_location_name='Harbour'))
+    db.session.expire_all()  # as a new request would see it
+    assert get_lot_catalog()[0].prime_location_name == 'Central'
+    bump_catalog_version(LOT_CATALOG)
+    assert get_lot_catalog()[0].prime_location_name == 'Harbour'
+
+
+def test_search_matches_name_address_or_pin_code(app, lot_with_spot):
+    lot, _ = lot_with_spot
+    assert [record.id for record in search_lot_catalog('centr')] == [lot.id]
+    assert [record.id for record in search_lot_catalog('4000')] == [lot.id]
+    assert search_lot_catalog('nowhere') == []
+
+
+def test_soft_deleted_lots_leave_the_catalog(app, lot_with_spot, today):
+    lot, _ = lot_with_spot
+    assert len(get_lot_catalog()) == 1
+    lot.deleted_at = today
+    db.session.commit()
+    assert get_lot_catalog() == ()
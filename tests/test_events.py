@@ -0,0 +1,64 @@
+import json
+import logging
+import queue
+from datetime import datetime
+
+import pytest
+
+import events
+from events import DroppingQueueHandler, JsonLinesWriter, log_event
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    handler = ListHandler()
+    events.logger.addHandler(handler)
+    yield handler.records
+    events.logger.removeHandler(handler)
+
+
+def test_events_carry_their_fields(captured):
+    log_event('checkout', booking_id=7, spot_id=3)
+    assert [(r.getMessage(), r.fields) for r in captured] == [('checkout', {'booking_id': 7, 'spot_id': 3})]
+
+
+@pytest.mark.parametrize('draw, kept', [(0.05, True), (0.5, False)])
+def test_sampled_events_record_their_rate(captured, monkeypatch, draw, kept):
+    monkeypatch.setitem(events._sample_rates, 'search', 0.1)
+    monkeypatch.setattr(events.random, 'random', lambda: draw)
+    log_event('search', results=4)
+    assert [r.fields for r in captured] == ([{'results': 4, 'sample_rate': 0.1}] if kept else [])
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    for i in range(5):
+        handler.handle(logging.makeLogRecord({'msg': f'event{i}'}))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_writer_drains_the_queue_as_json_lines(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    event_queue = queue.Queue()
+    writer = JsonLinesWriter(event_queue, str(path), batch_size=2, flush_interval=0.01)
+    for i in range(5):
+        event_queue.put(logging.makeLogRecord({'msg': 'booking_created', 'fields': {'booking_id': i,
+                                                                                    'start': datetime(2026, 3, 2, 9)}}))
+    writer.start()
+    writer.stop()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['booking_id'] for line in lines] == [0, 1, 2, 3, 4]
+    assert lines[0]['event'] == 'booking_created'
+    assert lines[0]['start'] == '2026-03-02 09:00:00'
+    assert lines[0]['ts'].endswith('Z')
@@ -0,0 +1,126 @@
+import smtplib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+import notifications
+from models import db, EmailJob
+from notifications import claim_due_jobs, send_due_emails, _retry_later
+
+
+class FakeConnection:
+    """Stands in for a Flask-Mail SMTP connection; refuses the recipients it is given."""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.sent = []
+
+    def send(self, message):
+        if message.recipients[0] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({message.recipients[0]: (550, b'no such user')})
+        self.sent.append(message)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    connection = FakeConnection()
+
+    @contextmanager
+    def connect():
+        yield connection
+    monkeypatch.setattr(notifications.mail, 'connect', connect)
+    return connection
+
+
+def add_job(recipient='a@example.test', due_in=timedelta(0)):
+    job = EmailJob(kind='receipt', recipient=recipient, subject='Receipt', body='Thanks',
+                   next_attempt_at=datetime.now() + due_in)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def test_claim_takes_due_jobs_up_to_the_batch_size(app):
+    due = [add_job(due_in=timedelta(minutes=-i)) for i in range(3)]
+    later = add_job(due_in=timedelta(hours=1))
+
+    claimed = claim_due_jobs(batch_size=2)
+
+    assert len(claimed) == 2
+    assert {job.id for job in claimed} <= {job.id for job in due}
+    assert all(job.status == 'sending' and job.next_attempt_at > datetime.now() for job in claimed)
+    assert len({job.claimed_by for job in claimed}) == 1
+    assert db.session.get(EmailJob, later.id).status == 'pending'
+
+
+def test_claimed_jobs_are_not_claimed_twice(app):
+    add_job()
+    assert len(claim_due_jobs(batch_size=10)) == 1
+    assert claim_due_jobs(batch_size=10) == []
+
+
+def test_lapsed_claim_is_picked_up_again(app):
+    add_job()
+    first, = claim_due_jobs(batch_size=10)
+    first_token = first.claimed_by
+
+    # The first worker died mid-batch and its lease ran out
+    first.next_attempt_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+
+    second, = claim_due_jobs(batch_size=10)
+    assert second.id == first.id
+    assert second.status == 'sending'
+    assert second.claimed_by != first_token
+
+
+def test_retry_backs_off_exponentially_until_it_fails(app):
+    job = add_job()
+    delays = []
+    for _ in range(3):
+        before = datetime.now()
+        _retry_later(job, 'boom', max_attempts=4, retry_seconds=30)
+        assert job.status == 'pending' and job.claimed_by is None
+        delays.append(round((job.next_attempt_at - before).total_seconds()))
+    assert delays == [30, 60, 120]
+
+    _retry_later(job, 'boom', max_attempts=4, retry_seconds=30)
+    assert job.status == 'failed'
+    assert job.attempts == 4
+    assert job.last_error == 'boom'
+
+
+def test_retry_backoff_is_capped_at_an_hour(app):
+    job = add_job()
+    job.attempts = 20
+    before = datetime.now()
+    _retry_later(job, 'boom', max_attempts=50, retry_seconds=30)
+    assert round((job.next_attempt_at - before).total_seconds()) == 3600
+
+
+def test_refused_recipient_is_retried_alone(app, smtp):
+    good = add_job('good@example.test')
+    bad = add_job('bad@example.test')
+    smtp.refuse.add('bad@example.test')
+
+    assert send_due_emails(batch_size=10, max_attempts=5, retry_seconds=30) == 2
+
+    assert [message.recipients for message in smtp.sent] == [['good@example.test']]
+    assert db.session.get(EmailJob, good.id).status == 'sent'
+    bad = db.session.get(EmailJob, bad.id)
+    assert (bad.status, bad.attempts) == ('pending', 1)
+    assert bad.next_attempt_at > datetime.now()
+
+
+def test_broken_connection_requeues_the_batch(app, monkeypatch):
+    jobs = [add_job(), add_job()]
+
+    def connect():
+        raise ConnectionRefusedError('smtp down')
+    monkeypatch.setattr(notifications.mail, 'connect', connect)
+
+    assert send_due_emails(batch_size=10, max_attempts=5, retry_seconds=30) == 2
+    for job in jobs:
+        job = db.session.get(EmailJob, job.id)
+        assert (job.status, job.attempts, job.claimed_by) == ('pending', 1, None)
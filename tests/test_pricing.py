@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import pricing
+from models import db, ParkingLot, ParkingSpot
+from pricing import billable_hours, get_hourly_rates, quote_prices, surge_multipliers
+
+HOUR = datetime(2026, 3, 2, 9)
+
+
+@pytest.fixture(autouse=True)
+def fresh_rates():
+    pricing._rate_cache.clear()
+    yield
+    pricing._rate_cache.clear()
+
+
+def add_lot(name, price, occupied, total=10):
+    lot = ParkingLot(prime_location_name=name, address='1 Main St', pin_code='400001',
+                     price=price, maximum_number_of_spots=total)
+    db.session.add(lot)
+    db.session.flush()
+    db.session.add_all(ParkingSpot(lot_id=lot.id, number=n, status='O' if n <= occupied else 'A')
+                       for n in range(1, total + 1))
+    db.session.commit()
+    return lot
+
+
+@pytest.mark.parametrize('occupancy, multiplier', [
+    (0.0, 1.0), (0.69, 1.0), (0.7, 1.25), (0.89, 1.25), (0.9, 1.5), (1.0, 1.5),
+])
+def test_surge_tier_is_the_highest_reached(occupancy, multiplier):
+    assert surge_multipliers(np.array([occupancy]))[0] == multiplier
+
+
+def test_partial_hours_are_billed_as_whole_hours():
+    windows = [(HOUR, HOUR + timedelta(minutes=m)) for m in (1, 60, 61, 150)]
+    assert billable_hours(windows).tolist() == [1, 1, 2, 3]
+
+
+def test_quote_prices_every_lot_for_every_window(app):
+    quiet = add_lot('Quiet', 40, occupied=1)
+    busy = add_lot('Busy', 100, occupied=7)
+    full = add_lot('Full', 20, occupied=10)
+    windows = [(HOUR, HOUR + timedelta(hours=1)), (HOUR, HOUR + timedelta(minutes=90))]
+
+    prices = quote_prices([quiet, busy, full], windows, now=HOUR)
+
+    assert prices.tolist() == [[40, 80], [125, 250], [30, 60]]
+    assert quote_prices([], windows).shape == (0, 2)
+
+
+def test_rates_hold_for_the_hour_and_follow_price_edits(app):
+    lot = add_lot('Central', 40, occupied=0)
+    assert get_hourly_rates([lot], now=HOUR).tolist() == [40]
+
+    # More cars within the hour do not move the rate...
+    ParkingSpot.query.filter_by(lot_id=lot.id).update({'status': 'O'})
+    db.session.commit()
+    assert get_hourly_rates([lot], now=HOUR + timedelta(minutes=30)).tolist() == [40]
+    # ...but the next hour, or an edited price, does
+    assert get_hourly_rates([lot], now=HOUR + timedelta(hours=1)).tolist() == [60]
+    lot.price = 50
+    db.session.commit()
+    assert get_hourly_rates([lot], now=HOUR).tolist() == [75]
+
+
+def test_quote_route_checks_its_limits(app, client, login, make_user, monkeypatch):
+    lot = add_lot('Central', 40, occupied=0)
+    login(make_user('driver'))
+    window = [HOUR.isoformat(), (HOUR + timedelta(hours=2)).isoformat()]
+
+    response = client.post('/user/quote', json={'lot_ids': [lot.id], 'windows': [window]})
+    assert response.get_json()['prices'] == [[80]]
+
+    monkeypatch.setitem(app.config, 'QUOTE_MAX_WINDOWS', 1)
+    assert client.post('/user/quote', json={'lot_ids': [lot.id], 'windows': [window, window]}).status_code == 400
+    assert client.post('/user/quote', json={'lot_ids': [lot.id], 'windows': [window[::-1]]}).status_code == 400
+    assert client.post('/user/quote', json={'lot_ids': ['x'], 'windows': [window]}).status_code == 400
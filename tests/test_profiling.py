@@ -0,0 +1,58 @@
+from collections import Counter
+
+from models import ProfileReport
+from profiling import build_call_tree, collapsed_stacks, flatten_call_tree, get_profile_report
+
+
+STACKS = Counter({
+    ('view', 'query', 'execute'): 6,
+    ('view', 'query'): 1,
+    ('view', 'render'): 3,
+})
+
+
+def test_call_tree_nests_stacks_busiest_first():
+    tree = build_call_tree(STACKS)
+    assert tree['samples'] == 10
+    view = tree['children'][0]
+    assert [(child['name'], child['samples']) for child in view['children']] == [('query', 7), ('render', 3)]
+
+
+def test_flattened_tree_reports_self_time_and_drops_small_branches():
+    rows = flatten_call_tree(build_call_tree(STACKS), min_share=0.5)
+    assert rows == [(0, 'request', 10, 0), (1, 'view', 10, 0), (2, 'query', 7, 1), (3, 'execute', 6, 6)]
+
+
+def test_collapsed_stacks_are_flamegraph_lines():
+    assert collapsed_stacks(STACKS).splitlines() == [
+        'request;view;query;execute 6', 'request;view;render 3', 'request;view;query 1',
+    ]
+
+
+def test_admin_can_profile_a_request(app, client, login, lot_with_spot):
+    login(admin=True)
+    response = client.get('/admin/dashboard', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+
+    row, report = get_profile_report(int(response.headers['X-Profile-Id']))
+    assert (row.method, row.path, row.status_code) == ('GET', '/admin/dashboard', 200)
+    assert row.sql_count == len(report['statements']) > 0
+    assert any('parking_lot' in item['statement'] for item in report['statement_totals'])
+
+    assert client.get(f'/admin/profiles/{row.id}').status_code == 200
+    collapsed = client.get(f'/admin/profiles/{row.id}/collapsed.txt')
+    assert collapsed.get_data(as_text=True) == report['collapsed'] + '\n'
+
+
+def test_unrequested_or_non_admin_requests_are_not_profiled(app, client, login, make_user):
+    assert 'X-Profile-Id' not in client.get('/', headers={'X-Profile': '1'}).headers
+    login(admin=True)
+    assert 'X-Profile-Id' not in client.get('/admin/dashboard').headers
+    assert ProfileReport.query.count() == 0
+
+
+def test_only_the_newest_reports_are_kept(app, client, login, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_KEEP', 2)
+    login(admin=True)
+    ids = [int(client.get('/admin/dashboard?_profile=1').headers['X-Profile-Id']) for _ in range(4)]
+    assert sorted(row.id for row in ProfileReport.query) == ids[2:]
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, EmailJob, ParkingLot, ParkingSpot, Reservation, ACTIVE, COMPLETED
+from purge import purge_deleted_lot
+from userstats import get_user_stats, compute_user_stats
+
+
+@pytest.fixture
+def bookings(lot_with_spot, make_user):
+    """A live and a finished booking on the lot's spot, each with an email queued."""
+    lot, spot = lot_with_spot
+    user = make_user('driver')
+    now = datetime.now()
+    live = Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=now - timedelta(hours=1),
+                       leaving_timestamp=now + timedelta(hours=1), parking_cost=80, status=ACTIVE)
+    done = Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=now - timedelta(hours=5),
+                       leaving_timestamp=now - timedelta(hours=3), parking_cost=80, status=COMPLETED)
+    spot.status = 'O'
+    db.session.add_all([live, done])
+    db.session.commit()
+    for reservation, status in ((live, 'pending'), (done, 'sent')):
+        db.session.add(EmailJob(kind='reminder', recipient=user.email, subject='Reminder', body='Soon',
+                                reservation_id=reservation.id, status=status))
+    # Built from the rows above: one active booking
+    assert get_user_stats(user.id).active_bookings == 1
+    db.session.commit()
+    return user, live.id, done.id
+
+
+def active_bookings(user):
+    db.session.expire_all()
+    return get_user_stats(user.id).active_bookings
+
+
+def test_purging_a_lot_closes_its_live_bookings_first(app, lot_with_spot, bookings):
+    lot, spot = lot_with_spot
+    user, live, done = bookings
+
+    lot_id = lot.id
+
+    assert purge_deleted_lot(lot_id, batch_size=1) == 3
+
+    assert active_bookings(user) == 0 == compute_user_stats(user.id).active_bookings
+    # The unsent reminder goes with its booking; sent mail is history
+    assert EmailJob.query.filter_by(reservation_id=live).count() == 0
+    assert EmailJob.query.filter_by(reservation_id=done).count() == 1
+    assert Reservation.query.count() == 0
+    assert db.session.get(ParkingLot, lot_id) is None
+
+
+def test_deleting_a_spot_closes_its_live_bookings_first(app, client, login, lot_with_spot, bookings):
+    lot, spot = lot_with_spot
+    user, live, done = bookings
+    login(admin=True)
+
+    assert client.post(f'/admin/delete_spot/{spot.id}').status_code == 302
+
+    assert active_bookings(user) == 0
+    assert EmailJob.query.filter_by(reservation_id=live).count() == 0
+    assert Reservation.query.count() == 0
+    assert db.session.get(ParkingSpot, spot.id) is None
@@ -0,0 +1,90 @@
+import sqlite3
+import time
+
+import pytest
+
+from ratelimit import SharedLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return SharedLimiter(str(tmp_path / 'limits.sqlite3'))
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(limiter, clock):
+    assert [limiter.take_token('k', rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert limiter.take_token('k', rate=2, burst=3) == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert limiter.take_token('k', rate=2, burst=3) == 0
+    assert limiter.take_token('k', rate=2, burst=3) > 0
+
+    # Buckets are per key
+    assert limiter.take_token('other', rate=2, burst=3) == 0
+
+
+def test_refill_never_exceeds_the_burst(limiter, clock):
+    limiter.take_token('k', rate=1, burst=2)
+    clock[0] += 3600
+    assert [limiter.take_token('k', rate=1, burst=2) for _ in range(3)][-1] > 0
+
+
+def test_concurrency_cap_and_release(limiter):
+    first = limiter.acquire_slot('search', limit=1)
+    assert first is not None
+    assert limiter.acquire_slot('search', limit=1) is None
+    assert limiter.acquire_slot('other', limit=1) is not None
+
+    limiter.release_slot(first)
+    assert limiter.acquire_slot('search', limit=1) is not None
+
+
+def test_slot_left_by_a_dead_worker_expires(limiter, clock):
+    limiter.acquire_slot('search', limit=1)
+    clock[0] += 31
+    assert limiter.acquire_slot('search', limit=1, stale_after=30) is not None
+
+
+@pytest.fixture
+def limited(app, tmp_path, monkeypatch, make_user, login):
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_DB', str(tmp_path / 'limits.sqlite3'))
+    monkeypatch.setitem(app.config, 'SEARCH_RATE', 1)
+    monkeypatch.setitem(app.config, 'SEARCH_BURST', 1)
+    login(make_user('searcher'))
+    return app.config
+
+
+def search(client):
+    return client.post('/user/search_parking_ajax', data={'query': 'x'})
+
+
+def test_search_over_the_rate_gets_429_with_retry_after(limited, client):
+    assert search(client).status_code == 200
+    response = search(client)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_rate_zero_turns_the_bucket_off(limited, client, monkeypatch):
+    monkeypatch.setitem(limited, 'SEARCH_RATE', 0)
+    assert [search(client).status_code for _ in range(5)] == [200] * 5
+
+
+def test_locked_limiter_sheds_load(limited, client, monkeypatch):
+    monkeypatch.setitem(limited, 'SEARCH_BURST', 100)
+    blocker = sqlite3.connect(limited['RATE_LIMIT_DB'], isolation_level=None)
+    assert search(client).status_code == 200  # creates the tables
+    blocker.execute('BEGIN IMMEDIATE')
+    try:
+        assert search(client).status_code == 429
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import event
+
+from models import db, ArchivedReservation, ParkingSpot, Reservation, BOOKED, ACTIVE, COMPLETED, CANCELLED
+from readmodels import get_active_booking_rows, get_past_booking_rows, get_recent_booking_rows, \
+    iter_booking_history_rows
+
+
+@pytest.fixture
+def bookings(lot_with_spot, make_user, today):
+    """A user's bookings across every status, one of them archived, and another user's booking."""
+    lot, spot = lot_with_spot
+    second = ParkingSpot(lot_id=lot.id, number=2)
+    db.session.add(second)
+    db.session.flush()
+    user, other = make_user('driver'), make_user('other')
+
+    def add(name, start_hours, status, spot=spot, owner=user, model=Reservation):
+        start = today + timedelta(hours=start_hours)
+        values = dict(spot_id=spot.id, user_id=owner.id, parking_timestamp=start,
+                      leaving_timestamp=start + timedelta(hours=1), parking_cost=40, status=status)
+        if model is ArchivedReservation:
+            values['id'] = 5000
+        row = model(**values)
+        db.session.add(row)
+        return name, row
+
+    rows = dict([
+        add('later', 3, BOOKED),
+        add('now', 0, ACTIVE, spot=second),
+        add('ended', -3, ACTIVE),
+        add('yesterday', -24, BOOKED),
+        add('done', -5, COMPLETED),
+        add('cancelled', -2, CANCELLED),
+        add('archived', -24 * 40, COMPLETED, model=ArchivedReservation),
+        add('theirs', 1, BOOKED, owner=other),
+    ])
+    db.session.commit()
+    return user, {name: row.id for name, row in rows.items()}
+
+
+def ids(rows, names):
+    return [rows[name] for name in names]
+
+
+def test_active_rows_are_todays_unfinished_bookings_soonest_first(app, bookings, today):
+    user, rows = bookings
+    active = get_active_booking_rows(user.id, today + timedelta(minutes=30))
+    assert [row.id for row in active] == ids(rows, ['now', 'later'])
+    assert [row.spot_number for row in active] == [2, 1]
+    assert active[0].lot_name == 'Central'
+
+
+def test_past_rows_end_with_the_archive(app, bookings):
+    user, rows = bookings
+    past = get_past_booking_rows(user.id)
+    assert [row.id for row in past] == ids(rows, ['cancelled', 'done', 'archived'])
+    assert [row.is_archived for row in past] == [False, False, True]
+
+
+def test_recent_rows_are_newest_first_and_limited(app, bookings):
+    user, rows = bookings
+    assert [row.id for row in get_recent_booking_rows(user.id, limit=2)] == ids(rows, ['later', 'now'])
+    assert [row.id for row in get_recent_booking_rows(limit=1)] == ids(rows, ['later'])
+
+
+def test_history_streams_live_then_archived_rows(app, bookings):
+    user, rows = bookings
+    history = [row.id for row in iter_booking_history_rows(user.id, chunk_size=2)]
+    assert history == ids(rows, ['later', 'now', 'cancelled', 'ended', 'done', 'yesterday', 'archived'])
+
+
+def test_rendering_rows_issues_no_further_queries(app, bookings):
+    user_id = bookings[0].id
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        past = get_past_booking_rows(user_id)
+        [(row.lot_name, row.spot_number) for row in past]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    # One joined SELECT for live rows and one for archived rows
+    assert len(statements) == 2
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from models import db, ParkingSpot, Reservation, BOOKED, ACTIVE, COMPLETED, CANCELLED
+from user import close_reservation
+from userstats import get_user_stats, record_booking_closed
+
+
+@pytest.mark.parametrize('start, end', [
+    (BOOKED, ACTIVE),
+    (BOOKED, COMPLETED),
+    (BOOKED, CANCELLED),
+    (ACTIVE, COMPLETED),
+    (ACTIVE, CANCELLED),
+])
+def test_allowed_transitions(start, end):
+    reservation = Reservation(status=start)
+    reservation.move_to(end)
+    assert reservation.status == end
+
+
+@pytest.mark.parametrize('start, end', [
+    (ACTIVE, BOOKED),
+    (ACTIVE, ACTIVE),
+    (COMPLETED, CANCELLED),
+    (COMPLETED, ACTIVE),
+    (CANCELLED, COMPLETED),
+    (CANCELLED, BOOKED),
+])
+def test_forbidden_transitions(start, end):
+    reservation = Reservation(status=start)
+    with pytest.raises(ValueError, match=f'already {start}'):
+        reservation.move_to(end)
+    assert reservation.status == start
+
+
+@pytest.fixture
+def live_booking(lot_with_spot, make_user, today):
+    _, spot = lot_with_spot
+    user = make_user('driver')
+    booking = Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=today - timedelta(hours=2),
+                          leaving_timestamp=today + timedelta(hours=1), parking_cost=120, status=ACTIVE)
+    spot.status = 'O'
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def test_booking_read_by_two_requests_is_closed_once(app, live_booking):
+    assert get_user_stats(live_booking.user_id).active_bookings == 1
+    now = live_booking.leaving_timestamp
+
+    # A second request (say, an expiry sweep) read the booking while it was still live
+    with Session(db.engine) as other:
+        stale = other.get(Reservation, live_booking.id)
+
+        close_reservation(live_booking, CANCELLED, now)
+        record_booking_closed(live_booking.user_id)
+        db.session.commit()
+
+        with pytest.raises(ValueError, match='already closed'):
+            close_reservation(stale, COMPLETED, now)
+        other.rollback()
+
+    db.session.expire_all()
+    assert db.session.get(Reservation, live_booking.id).status == CANCELLED
+    assert db.session.get(ParkingSpot, live_booking.spot_id).status == 'A'
+    assert get_user_stats(live_booking.user_id).active_bookings == 0
+
+
+def test_closed_booking_cannot_be_closed_again(app, live_booking):
+    close_reservation(live_booking, COMPLETED, live_booking.leaving_timestamp)
+    with pytest.raises(ValueError, match='already completed'):
+        close_reservation(live_booking, CANCELLED, live_booking.leaving_timestamp)
@@ -0,0 +1,153 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import sharding
+import user as user_views
+from app import create_app
+from config import Config
+from models import db, ParkingLot, ParkingSpot, Reservation, COMPLETED
+from sharding import SHARD_ID_STRIDE, fan_out, init_shards, shard_for_id, shard_for_lot_id, shard_for_pin, shard_session
+from userstats import get_user_stats
+
+
+@pytest.mark.parametrize('row_id, key', [
+    (1, None),
+    (SHARD_ID_STRIDE - 1, None),
+    (SHARD_ID_STRIDE, 'shard1'),
+    (SHARD_ID_STRIDE + 3, 'shard1'),
+    (2 * SHARD_ID_STRIDE + 7, 'shard2'),
+    (str(SHARD_ID_STRIDE + 3), 'shard1'),
+    (None, None),
+    ('not-an-id', None),
+])
+def test_shard_for_id(row_id, key):
+    assert shard_for_id(row_id) == key
+
+
+@pytest.mark.parametrize('pin_code, key', [
+    ('561000', 'shard1'),
+    ('560001', 'shard2'),  # '560' beats '56'
+    ('560123', 'shard3'),  # '5601' beats both
+    ('110001', 'shard3'),
+    ('400001', None),
+    ('', None),
+    (None, None),
+])
+def test_shard_for_pin_longest_prefix_wins(app, monkeypatch, pin_code, key):
+    monkeypatch.setitem(app.config, 'SHARDS', [
+        (['56'], 'sqlite://'),
+        (['560'], 'sqlite://'),
+        (['5601', '11'], 'sqlite://'),
+    ])
+    assert shard_for_pin(pin_code) == key
+
+
+def test_shard_for_pin_unsharded(app):
+    assert shard_for_pin('560001') is None
+
+
+# ----------------------------
+# Two regional shards on local SQLite files
+# ----------------------------
+class TestTwoShards:
+    @pytest.fixture
+    def app(self, tmp_path, monkeypatch):
+        """An app whose 56xxxx lots live in south.db and 11xxxx lots in north.db."""
+        shards = [(['56'], f"sqlite:///{tmp_path / 'south.db'}"), (['11'], f"sqlite:///{tmp_path / 'north.db'}")]
+        monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'main.db'}")
+        monkeypatch.setattr(Config, 'SHARDS', shards)
+        monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {f'shard{i}': url for i, (_, url) in enumerate(shards, start=1)})
+        monkeypatch.setattr(sharding, '_lot_shards', {})
+        sharded_app = create_app()
+        sharded_app.config['TESTING'] = True
+        with sharded_app.app_context():
+            db.create_all()
+            init_shards()
+            yield sharded_app
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+    @pytest.fixture
+    def lots(self, client, login):
+        """Two spots in each of a south, a north and an unsharded lot, added through the admin pages."""
+        login(admin=True)
+        for name, pin_code in [('South', '560001'), ('North', '110001'), ('West', '400001')]:
+            client.post('/admin/lot/add', data={'name': name, 'address': '1 Main St', 'pin_code': pin_code,
+                                                'price': '40', 'maximum_spots': '5'})
+        lots = {lot.prime_location_name: lot for lot in ParkingLot.query}
+        for lot in lots.values():
+            client.post(f'/admin/add_spots/{lot.id}', data={'number_of_spots': '2'})
+        return lots
+
+    @staticmethod
+    def spots_of(lot):
+        return sharding.session_for_lot(lot.id).query(ParkingSpot).filter_by(lot_id=lot.id).order_by(ParkingSpot.id).all()
+
+    def test_spots_are_stored_in_their_lots_shard_with_its_id_range(self, app, lots):
+        for name, key in [('South', 'shard1'), ('North', 'shard2'), ('West', None)]:
+            spots = self.spots_of(lots[name])
+            assert [spot.number for spot in spots] == [1, 2]
+            assert all(shard_for_id(spot.id) == key for spot in spots)
+            assert shard_session(key).query(ParkingSpot).filter_by(lot_id=lots[name].id).count() == 2
+        assert db.session.query(ParkingSpot).count() == 2
+
+    def test_unknown_lot_id_is_not_cached(self, app):
+        assert shard_for_lot_id(1) is None
+        # Added by another worker, so this process's mirror_lot never saw it
+        db.session.add(ParkingLot(id=1, prime_location_name='South', address='1 Main St', pin_code='560001',
+                                  price=40, maximum_number_of_spots=5))
+        db.session.commit()
+        assert shard_for_lot_id(1) == 'shard1'
+
+    def test_fan_out_visits_every_shard_in_order(self, app, lots):
+        results = fan_out(lambda session: (session.info.get('shard'), session.query(ParkingSpot.id).count()))
+        assert results == [(None, 2), ('shard1', 2), ('shard2', 2)]
+
+    def test_booking_checkout_and_export_across_shards(self, app, lots, make_user, client, login):
+        start = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=5)
+        end = start + timedelta(minutes=60)
+        if end.date() != datetime.now().date():
+            pytest.skip("bookings are for today only")
+        user = make_user('driver')
+        login(user)
+
+        south, west = self.spots_of(lots['South'])[0], self.spots_of(lots['West'])[0]
+        for spot in (south, west):
+            client.post('/user/book', data={'spot_id': spot.id, 'start_time': start.isoformat(),
+                                            'end_time': end.isoformat()})
+        south_booking = shard_session('shard1').query(Reservation).one()
+        west_booking = db.session.query(Reservation).one()
+        assert shard_for_id(south_booking.id) == 'shard1'
+        assert shard_for_id(west_booking.id) is None
+
+        # Under way, so it can be checked out
+        south_booking.parking_timestamp = datetime.now() - timedelta(minutes=1)
+        shard_session('shard1').commit()
+        client.post(f'/user/checkout/{south_booking.id}')
+        shard_session('shard1').expire_all()
+        assert shard_session('shard1').get(Reservation, south_booking.id).status == COMPLETED
+        assert shard_session('shard1').get(ParkingSpot, south.id).status == 'A'
+        assert get_user_stats(user.id).active_bookings == 1
+
+        rows = list(csv.reader(io.StringIO(client.get('/user/my_bookings/export').get_data(as_text=True))))
+        assert sorted(int(row[0]) for row in rows[1:]) == sorted([south_booking.id, west_booking.id])
+
+    def test_booking_is_taken_back_out_of_its_shard_when_the_main_commit_fails(self, app, lots, make_user, monkeypatch):
+        def fail(*args, **kwargs):
+            raise RuntimeError("main database unavailable")
+        monkeypatch.setattr(user_views, 'queue_booking_emails', fail)
+        driver = make_user('driver')
+        spot = self.spots_of(lots['South'])[0]
+        start = datetime.now() + timedelta(minutes=5)
+
+        with pytest.raises(ValueError, match="Error committing reservation"):
+            user_views.create_reservation(driver.id, spot, lots['South'], start, start + timedelta(hours=1), 40, 0, '')
+
+        shard_session('shard1').expire_all()
+        assert shard_session('shard1').query(Reservation).count() == 0
+        assert shard_session('shard1').get(ParkingSpot, spot.id).status == 'A'
+        assert get_user_stats(driver.id).active_bookings == 0
@@ -0,0 +1,55 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from admin import spot_grid_cache
+from catalog import bump_catalog_version, get_catalog_version, spot_grid_catalog
+from models import db, ParkingSpot
+
+
+def grid(client, lot):
+    return client.get(f'/admin/parking_spots/{lot.id}/grid').get_data(as_text=True)
+
+
+def test_grid_is_cached_under_the_lots_spot_version(app, client, login, lot_with_spot):
+    lot, _ = lot_with_spot
+    login(admin=True)
+    spot_grid_cache.clear()
+
+    html = grid(client, lot)
+    assert 'available' in html
+    assert spot_grid_cache.get((lot.id, get_catalog_version(spot_grid_catalog(lot.id)))) == html
+
+
+def test_spot_write_bumps_the_lots_version(app, lot_with_spot):
+    lot, spot = lot_with_spot
+    before = get_catalog_version(spot_grid_catalog(lot.id))
+    with Session(db.engine) as other:
+        other.get(ParkingSpot, spot.id).status = 'O'
+        other.commit()
+    assert get_catalog_version(spot_grid_catalog(lot.id)) == before + 1
+
+
+def test_change_made_by_another_worker_shows_at_once(app, client, login, lot_with_spot):
+    lot, spot = lot_with_spot
+    login(admin=True)
+    spot_grid_cache.clear()
+    assert 'occupied' not in grid(client, lot)
+
+    # What another worker's booking leaves behind: the row and the version, but nothing in this process
+    with db.engine.begin() as connection:
+        connection.execute(update(ParkingSpot).where(ParkingSpot.id == spot.id).values(status='O'))
+    bump_catalog_version(spot_grid_catalog(lot.id))
+
+    assert 'occupied' in grid(client, lot)
+
+
+def test_adding_spots_moves_the_version(app, client, login, lot_with_spot):
+    lot, _ = lot_with_spot
+    lot.maximum_number_of_spots = 3
+    db.session.commit()
+    login(admin=True)
+    spot_grid_cache.clear()
+    assert grid(client, lot).count('spot-box') == 1
+
+    client.post(f'/admin/add_spots/{lot.id}', data={'number_of_spots': '2'})
+    assert grid(client, lot).count('spot-box') == 3
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, ParkingSpot, Reservation, UserStats
+from user import auto_release_expired_reservations, create_reservation
+from userstats import compute_user_stats, get_user_stats, rebuild_all_user_stats
+
+
+def figures(stats):
+    return stats.total_bookings, stats.active_bookings, stats.total_spent, stats.last_booking_at
+
+
+@pytest.fixture
+def spots(lot_with_spot):
+    lot, spot = lot_with_spot
+    extra = [ParkingSpot(lot_id=lot.id, number=n) for n in (2, 3, 4)]
+    db.session.add_all(extra)
+    db.session.commit()
+    return lot, [spot] + extra
+
+
+def test_counters_kept_by_bookings_match_a_rebuild(app, client, login, make_user, spots):
+    lot, (cancelled, checked_out, expired, kept) = spots
+    user = make_user('driver')
+    login(user)
+    assert figures(get_user_stats(user.id)) == (0, 0, 0, None)
+
+    now = datetime.now().replace(microsecond=0)
+    windows = {
+        cancelled: (now + timedelta(hours=1), now + timedelta(hours=2), 40),
+        checked_out: (now - timedelta(minutes=30), now + timedelta(hours=1), 80),
+        expired: (now - timedelta(hours=3), now - timedelta(hours=1), 80),
+        kept: (now + timedelta(hours=2), now + timedelta(hours=5), 120),
+    }
+    booking_ids = {
+        spot: create_reservation(user.id, spot, lot, start, end, cost, 0, '').id
+        for spot, (start, end, cost) in windows.items()
+    }
+    client.post(f'/user/cancel/{booking_ids[cancelled]}')
+    client.post(f'/user/checkout/{booking_ids[checked_out]}')
+    auto_release_expired_reservations()
+    # Closing twice must not count twice
+    client.post(f'/user/cancel/{booking_ids[cancelled]}')
+
+    db.session.expire_all()
+    incremental = db.session.get(UserStats, user.id)
+    assert figures(incremental) == (4, 1, 320, windows[kept][0])
+    assert figures(incremental) == figures(compute_user_stats(user.id))
+
+
+def test_missing_row_is_rebuilt_from_the_bookings(app, make_user, spots):
+    lot, (spot, *_) = spots
+    user = make_user('driver')
+    start = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+    db.session.add(Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=start,
+                               leaving_timestamp=start + timedelta(hours=1), parking_cost=40))
+    db.session.commit()
+
+    assert db.session.get(UserStats, user.id) is None
+    assert figures(get_user_stats(user.id)) == (1, 1, 40, start)
+
+
+def test_rebuild_all_repairs_drifted_counters(app, make_user, spots):
+    users = [make_user(f'driver{i}') for i in range(3)]
+    for user in users:
+        get_user_stats(user.id)
+    db.session.get(UserStats, users[1].id).active_bookings = 7
+    db.session.commit()
+
+    assert rebuild_all_user_stats(batch_size=2) == 3
+    assert [db.session.get(UserStats, user.id).active_bookings for user in users] == [0, 0, 0]
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, EmailJob, Reservation, WaitlistEntry, BOOKED, ACTIVE, CANCELLED
+from user import close_reservation, serve_waitlist
+from waitlist import join_waitlist, expire_waitlist, queue_position
+
+
+@pytest.fixture
+def now():
+    return datetime.now().replace(microsecond=0)
+
+
+def book(spot, user, start, end, status=BOOKED):
+    reservation = Reservation(spot_id=spot.id, user_id=user.id, parking_timestamp=start,
+                              leaving_timestamp=end, parking_cost=40, status=status)
+    spot.status = 'O'
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation
+
+
+def cancel(reservation, now):
+    close_reservation(reservation, CANCELLED, now)
+    db.session.commit()
+
+
+def statuses(*entries):
+    return [db.session.get(WaitlistEntry, entry.id).status for entry in entries]
+
+
+@pytest.fixture
+def full_lot(lot_with_spot, make_user, now):
+    """The lot's only spot booked for the next hour and a half, then freed by cancelling."""
+    lot, spot = lot_with_spot
+    holder = make_user('holder')
+    booking = book(spot, holder, now + timedelta(minutes=5), now + timedelta(minutes=90))
+    return lot, spot, booking
+
+
+def test_first_come_entry_gets_the_offer(app, full_lot, make_user, now):
+    lot, spot, booking = full_lot
+    first = join_waitlist(make_user('first').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=40))
+    second = join_waitlist(make_user('second').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=80))
+    assert queue_position(second) == 2
+
+    cancel(booking, now)
+    serve_waitlist([spot.id], now)
+
+    assert statuses(first, second) == ['offered', 'waiting']
+    assert db.session.get(WaitlistEntry, first.id).spot_id == spot.id
+    assert queue_position(second) == 1
+    job = EmailJob.query.filter_by(kind='waitlist_offer').one()
+    assert job.recipient == 'first@example.test'
+
+
+def test_best_fit_prefers_the_window_that_leaves_least_idle_time(app, full_lot, make_user, now, monkeypatch):
+    monkeypatch.setitem(app.config, 'WAITLIST_POLICY', 'best_fit')
+    lot, spot, booking = full_lot
+    short = join_waitlist(make_user('short').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=40))
+    long = join_waitlist(make_user('long').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=80))
+
+    cancel(booking, now)
+    serve_waitlist([spot.id], now)
+
+    assert statuses(short, long) == ['waiting', 'offered']
+
+
+def test_lapsed_offer_expires_and_frees_the_spot_for_the_next_in_line(app, full_lot, make_user, now):
+    lot, spot, booking = full_lot
+    first = join_waitlist(make_user('first').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=40))
+    second = join_waitlist(make_user('second').id, lot.id, now + timedelta(minutes=10), now + timedelta(minutes=80))
+    cancel(booking, now)
+    serve_waitlist([spot.id], now)
+
+    later = now + timedelta(minutes=app.config['WAITLIST_OFFER_MINUTES'], seconds=1)
+    lapsed = expire_waitlist(later)
+    db.session.commit()
+    assert lapsed == [spot.id]
+    assert statuses(first, second) == ['expired', 'waiting']
+
+    serve_waitlist(lapsed, later)
+    assert statuses(first, second) == ['expired', 'offered']
+
+
+def test_waiting_entry_whose_window_has_passed_expires(app, lot_with_spot, make_user, now):
+    lot, _ = lot_with_spot
+    entry = join_waitlist(make_user('late').id, lot.id, now - timedelta(minutes=60), now - timedelta(minutes=1))
+    assert expire_waitlist(now) == []
+    db.session.commit()
+    assert statuses(entry) == ['expired']
+
+
+def test_auto_book_entry_is_booked_at_once(app, full_lot, make_user, now):
+    lot, spot, booking = full_lot
+    user = make_user('eager')
+    entry = join_waitlist(user.id, lot.id, now - timedelta(minutes=5), now + timedelta(minutes=60), auto_book=True)
+
+    cancel(booking, now)
+    serve_waitlist([spot.id], now)
+
+    entry = db.session.get(WaitlistEntry, entry.id)
+    assert (entry.status, entry.spot_id) == ('booked', spot.id)
+    reservation = db.session.get(Reservation, entry.reservation_id)
+    assert reservation.user_id == user.id
+    # A window already under way is booked from now
+    assert reservation.parking_timestamp == now
+    assert reservation.leaving_timestamp == entry.window_end
+    assert reservation.status == BOOKED
+
+
+def test_spot_still_in_use_is_not_offered(app, lot_with_spot, make_user, now):
+    lot, spot = lot_with_spot
+    book(spot, make_user('parked'), now - timedelta(minutes=10), now + timedelta(minutes=30), status=ACTIVE)
+    entry = join_waitlist(make_user('next').id, lot.id, now + timedelta(minutes=5), now + timedelta(minutes=20))
+
+    serve_waitlist([spot.id], now)
+
+    assert statuses(entry) == ['waiting']
+    assert EmailJob.query.filter_by(kind='waitlist_offer').count() == 0
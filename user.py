@@ -1,7 +1,21 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+import csv
+import io
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, Response, stream_with_context, abort, current_app
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
-from models import db, ParkingLot, ParkingSpot, Reservation
+from sqlalchemy import update
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from models import db, User, ParkingLot, ParkingSpot, Reservation, WaitlistEntry, BOOKED, ACTIVE, COMPLETED, CANCELLED
+from userstats import get_user_stats, record_booking_created, record_booking_closed
+from ratelimit import rate_limited
+from pricing import quote_prices, get_hourly_rates
+from events import log_event
+from catalog import get_lot_catalog, search_lot_catalog
+from readmodels import get_active_booking_rows, get_past_booking_rows, get_recent_booking_rows, iter_booking_history_rows
+from notifications import queue_booking_emails, queue_checkout_receipt, cancel_reminders, discard_booking_emails
+from sharding import fan_out, fan_out_lots, session_for_lot, session_for_id, commit_shard, rollback_shard
+from waitlist import join_waitlist, get_open_waitlist_rows, next_waitlist_entry, claim_entry, offer_spot, return_to_queue, expire_waitlist
 
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
@@ -20,8 +34,9 @@ def validate_today_booking(start_dt, end_dt):
 
 def check_spot_availability(spot, start_dt, end_dt):
     """Ensure the spot is free during the requested window."""
-    overlapping = Reservation.query.filter(
+    overlapping = object_session(spot).query(Reservation).filter(
         Reservation.spot_id == spot.id,
+        Reservation.live(),
         Reservation.leaving_timestamp > start_dt,
         Reservation.parking_timestamp < end_dt
     ).first()
@@ -29,9 +44,8 @@ def check_spot_availability(spot, start_dt, end_dt):
         raise ValueError("This spot is already booked in the selected time window.")
 
 def calculate_booking_cost(lot, start_dt, end_dt):
-    """Calculate cost rounded up to the nearest hour."""
-    hours = (end_dt - start_dt).total_seconds() / 3600
-    return lot.price * int(hours + 0.9999)
+    """Calculate cost at the lot's current surge rate, rounded up to the nearest hour."""
+    return float(quote_prices([lot], [(start_dt, end_dt)])[0, 0])
 
 def create_reservation(user_id, spot, lot, start_dt, end_dt, total_price, rating, feedback):
     reservation = Reservation(
@@ -41,122 +55,277 @@ def create_reservation(user_id, spot, lot, start_dt, end_dt, total_price, rating
         leaving_timestamp=end_dt,
         parking_cost=total_price,
         rating=rating if rating > 0 else None,
-        feedback=feedback if feedback else None
+        feedback=feedback if feedback else None,
+        status=BOOKED
     )
 
+    # The spot's own session: its regional shard, or db.session when unsharded
+    session = object_session(spot)
+    shard_committed = False
     try:
         spot.status = 'O'  # mark spot as occupied
-        db.session.add(reservation)
+        session.add(reservation)
+        session.flush()
+        commit_shard(session)
+        shard_committed = session is not db.session
+        record_booking_created(user_id, total_price, start_dt)
+        # Queued in the same commit as the counters; the mail worker sends them later
+        queue_booking_emails(db.session.get(User, user_id), reservation, lot.prime_location_name,
+                             current_app.config['MAIL_REMINDER_MINUTES'])
         db.session.commit()
-        print(f"[DB COMMIT SUCCESS] Reservation saved with ID: {reservation.id} "
-              f"for Spot #{spot.id}, User #{user_id}, "
-              f"from {start_dt} to {end_dt}, Cost: ₹{total_price}")
+        log_event('booking_created', booking_id=reservation.id, spot_id=spot.id, lot_id=lot.id,
+                  user_id=user_id, start=start_dt, end=end_dt, cost=total_price)
     except Exception as e:
+        rollback_shard(session)
         db.session.rollback()
-        print(f"[DB COMMIT ERROR] {e}")
+        if shard_committed:
+            # The booking is already in its shard but uncounted and unannounced; take it back out
+            session.delete(reservation)
+            release_spot(spot)
+            commit_shard(session)
+        log_event('booking_error', spot_id=spot.id, user_id=user_id, error=str(e))
         raise ValueError(f"Error committing reservation: {e}")
 
     return reservation
 
-    
-def get_active_bookings(user_id, now=None):
-    """Return active reservations for a user (today only)."""
-    if now is None:
-        now = datetime.now()
-    today = now.date()
-    return Reservation.query.filter(
-        Reservation.user_id == user_id,
-        Reservation.parking_timestamp >= datetime.combine(today, datetime.min.time()),
-        Reservation.leaving_timestamp <= datetime.combine(today, datetime.max.time())
-    ).all()
 
-def get_total_bookings(user_id):
-    """Return all reservations made by a user."""
-    return Reservation.query.filter_by(user_id=user_id).all()
+def auto_release_expired_reservations():
+    now = datetime.now()
+    released = []
+    for shard_released in fan_out(lambda session: _release_expired(session, now)):
+        released.extend(shard_released)
+
+    for booking_id, spot_id, user_id in released:
+        record_booking_closed(user_id)
+    cancel_reminders([booking_id for booking_id, _, _ in released])
+    # Also commits the booked -> active promotions when unsharded
+    db.session.commit()
+    for booking_id, spot_id, user_id in released:
+        log_event('expiry_release', booking_id=booking_id, spot_id=spot_id)
+
+    # Spots freed by expiry, and those whose waitlist offer lapsed, go to the next in line
+    lapsed_spot_ids = expire_waitlist(now)
+    db.session.commit()
+    serve_waitlist([spot_id for _, spot_id, _ in released] + lapsed_spot_ids, now)
 
 
-def get_total_spent(user_id):
-    return db.session.query(db.func.coalesce(db.func.sum(Reservation.parking_cost), 0))\
-        .filter(Reservation.user_id == user_id).scalar()
+def _release_expired(session, now):
+    # Bookings whose start has passed are now in use
+    session.query(Reservation).filter(
+        Reservation.status == BOOKED,
+        Reservation.parking_timestamp <= now,
+        Reservation.leaving_timestamp >= now
+    ).update({Reservation.status: ACTIVE}, synchronize_session=False)
 
-def auto_release_expired_reservations():
-    now = datetime.now()
-    expired_reservations = Reservation.query.filter(
-        Reservation.leaving_timestamp < now,
-        Reservation.spot.has(status='O')  # spot is still marked occupied
+    expired_reservations = session.query(Reservation).filter(
+        Reservation.live(),
+        Reservation.leaving_timestamp < now
     ).all()
 
+    released = []
     for reservation in expired_reservations:
-        reservation.spot.status = 'A'  # free the spot
-        db.session.add(reservation)
+        try:
+            close_reservation(reservation, COMPLETED, now)
+        except ValueError:
+            # A concurrent sweep, checkout or cancel closed it first and counted it
+            continue
+        released.append((reservation.id, reservation.spot_id, reservation.user_id))
+    commit_shard(session)
+    return released
+
+
+def close_reservation(reservation, status, now):
+    """Move a live booking to a final status, end it by `now` and free its spot.
+
+    The change is a conditional UPDATE on the row, not on the loaded object,
+    so of two requests that both read the booking as live only one closes it.
+    The other gets ValueError, as does closing a booking that is already
+    closed, so each booking is counted in the user's stats exactly once.
+    """
+    # Not move_to: a pending in-memory change would be flushed ahead of the conditional UPDATE
+    if status not in Reservation.TRANSITIONS[reservation.status]:
+        raise ValueError(f"This booking is already {reservation.status}.")
+    leaving = reservation.leaving_timestamp
+    if leaving is None or leaving > now:
+        # Cancelled before it started: no time used, rather than an end before the start
+        leaving = max(now, reservation.parking_timestamp)
+    session = object_session(reservation)
+    result = session.execute(
+        update(Reservation)
+        .where(Reservation.id == reservation.id, Reservation.can_move_to(status))
+        .values(status=status, leaving_timestamp=leaving)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise ValueError("This booking is already closed.")
+    # Already written above; keep the ORM from issuing a second, unconditional UPDATE
+    set_committed_value(reservation, 'status', status)
+    set_committed_value(reservation, 'leaving_timestamp', leaving)
+    release_spot(reservation.spot)
+
+
+def cancel_before_delete(session, reservation_ids, now):
+    """Cancel the live bookings among `reservation_ids` ahead of deleting them.
+
+    Uses the same close as a user's cancel, so each one leaves its user's
+    active count once, and drops the emails still queued about them.
+    Commits `session` and db.session.
+    """
+    live = session.query(Reservation).filter(Reservation.id.in_(reservation_ids), Reservation.live()).all()
+    closed_user_ids = []
+    for reservation in live:
+        try:
+            close_reservation(reservation, CANCELLED, now)
+        except ValueError:
+            # Closed concurrently; whoever closed it counted it
+            continue
+        closed_user_ids.append(reservation.user_id)
+    commit_shard(session)
+    for user_id in closed_user_ids:
+        record_booking_closed(user_id)
+    discard_booking_emails(reservation_ids)
+    db.session.commit()
+
+
+def release_spot(spot):
+    """Mark the spot available unless another live booking still holds it."""
+    still_held = object_session(spot).query(Reservation.id).filter(
+        Reservation.spot_id == spot.id,
+        Reservation.live()
+    ).first()
+    if still_held is None:
+        spot.status = 'A'
+
+
+def next_booking_start(session, spot_id, now):
+    """Start of the spot's next live booking after `now`, or None if it is free for the rest of time."""
+    return session.query(db.func.min(Reservation.parking_timestamp)).filter(
+        Reservation.spot_id == spot_id,
+        Reservation.live(),
+        Reservation.parking_timestamp > now
+    ).scalar()
+
+
+def serve_waitlist(spot_ids, now):
+    """Offer or book each freed spot for the next matching waitlist entry.
+
+    Runs after the freeing change is committed; a failure here is logged
+    and never undoes the checkout, cancel or expiry that triggered it.
+    """
+    for spot_id in dict.fromkeys(spot_ids):
+        try:
+            _serve_freed_spot(spot_id, now)
+        except Exception as e:
+            db.session.rollback()
+            log_event('waitlist_error', spot_id=spot_id, error=str(e))
+
+
+def _serve_freed_spot(spot_id, now):
+    session = session_for_id(spot_id)
+    spot = session.get(ParkingSpot, spot_id)
+    if spot is None or spot.lot.deleted_at:
+        return
+    free_until = next_booking_start(session, spot_id, now)
+    entry = next_waitlist_entry(spot.lot_id, now, free_until, current_app.config['WAITLIST_POLICY'])
+    if entry is None:
+        return
+    try:
+        if entry.auto_book:
+            book_waitlist_entry(entry, spot, now, from_status='waiting')
+        else:
+            # The spot may still be in use by a booking that began before now
+            start_dt = max(entry.window_start, now)
+            check_spot_availability(spot, start_dt, entry.window_end)
+            expires_at = now + timedelta(minutes=current_app.config['WAITLIST_OFFER_MINUTES'])
+            offer_spot(entry, spot, spot.lot.prime_location_name, start_dt, expires_at)
+    except ValueError as e:
+        # Still held by an overlapping booking; the entry keeps its place
+        log_event('waitlist_skipped', entry_id=entry.id, spot_id=spot_id, reason=str(e))
 
-    if expired_reservations:
-        db.session.commit()
+
+def book_waitlist_entry(entry, spot, now, from_status):
+    """Book the spot for the entry's window, from now if the window has begun.
+
+    Raises ValueError if the spot is not free for it. Returns None when
+    another request served the entry first.
+    """
+    start_dt = max(entry.window_start, now)
+    check_spot_availability(spot, start_dt, entry.window_end)
+    if not claim_entry(entry, from_status, 'booked', spot_id=spot.id):
+        db.session.rollback()
+        return None
+    total_price = calculate_booking_cost(spot.lot, start_dt, entry.window_end)
+    # Commits the claim together with the booking's counters and emails
+    reservation = create_reservation(entry.user_id, spot, spot.lot, start_dt, entry.window_end, total_price, 0, '')
+    entry.reservation_id = reservation.id
+    db.session.commit()
+    log_event('waitlist_booked', entry_id=entry.id, booking_id=reservation.id, spot_id=spot.id, user_id=entry.user_id)
+    return reservation
 
 @user_bp.route('/dashboard', methods=['GET', 'POST'])
 @login_required
 def user_dashboard():
-    now = datetime.now()
-    active_bookings = get_active_bookings(current_user.id, now)
-    total_bookings = get_total_bookings(current_user.id)
-    total_spent = get_total_spent(current_user.id)
+    stats = get_user_stats(current_user.id)
 
     query = request.form.get('query', '').strip() if request.method == 'POST' else ''
-    if query:
-        parking_lots = ParkingLot.query.filter(
-            (ParkingLot.pin_code.like(f"%{query}%")) |
-            (ParkingLot.prime_location_name.ilike(f"%{query}%")) |
-            (ParkingLot.address.ilike(f"%{query}%"))
-        ).all()
-    else:
-        parking_lots = ParkingLot.query.all()
+    parking_lots = search_lot_catalog(query) if query else list(get_lot_catalog())
 
-    def lot_to_dict(lot):
-        rate = getattr(lot, 'price_per_hour', getattr(lot, 'price', 0))
+    # Spot statuses are live data, so fetch them for the listed lots in one query
+    spots_by_lot = {}
+    for spot_rows in fan_out_lots(_spot_statuses, [lot.id for lot in parking_lots]):
+        for spot in spot_rows:
+            spots_by_lot.setdefault(spot.lot_id, []).append(spot)
+
+    def lot_to_dict(lot, rate):
         return {
             'id': lot.id,
             'prime_location_name': lot.prime_location_name,
             'address': lot.address,
             'pin_code': lot.pin_code,
-            'rate': rate,
+            'rate': float(rate),
             'spots': [
                 {
                     'id': spot.id,
-                    'number': getattr(spot, 'spot_number', spot.id),
+                    'number': spot.number,
                     'status': spot.status
                 }
-                for spot in lot.spots
+                for spot in spots_by_lot.get(lot.id, [])
             ]
         }
 
-    parking_lots_dict = [lot_to_dict(lot) for lot in parking_lots]
+    rates = get_hourly_rates(parking_lots)
+    parking_lots_dict = [lot_to_dict(lot, rate) for lot, rate in zip(parking_lots, rates)]
 
     notifications = []
-    recent_bookings = Reservation.query.filter_by(user_id=current_user.id)\
-        .order_by(Reservation.parking_timestamp.desc()).limit(5).all()
-    for b in recent_bookings:
+    for b in get_recent_booking_rows(current_user.id):
         notifications.append({
             'icon': 'fa-parking',
-            'message': f'Booking for Spot #{b.spot_id} at {b.lot.prime_location_name} confirmed!',
+            'message': f'Booking for Spot #{b.spot_number} at {b.lot_name} confirmed!',
             'time': b.parking_timestamp.strftime('%d %b %Y, %H:%M')
         })
 
     return render_template(
         'user/user_dashboard.html',
         parking_lots=parking_lots_dict,
-        active_count=len(active_bookings),
-        total_count=len(total_bookings),
-        total_spent=total_spent,
+        active_count=stats.active_bookings,
+        total_count=stats.total_bookings,
+        total_spent=stats.total_spent,
         search_query=query,
         notifications=notifications
     )
 
+def _spot_statuses(session, lot_ids):
+    return session.query(ParkingSpot.id, ParkingSpot.number, ParkingSpot.lot_id, ParkingSpot.status)\
+        .filter(ParkingSpot.lot_id.in_(lot_ids))\
+        .order_by(ParkingSpot.number).all()
+
 @user_bp.route('/available_spots/<int:lot_id>')
 @login_required
 def view_available_spots(lot_id):
     lot = ParkingLot.query.get_or_404(lot_id)
-    available_spots = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').all()
-    total_spots = ParkingSpot.query.filter_by(lot_id=lot_id).count()
+    session = session_for_lot(lot_id)
+    available_spots = session.query(ParkingSpot).filter_by(lot_id=lot_id, status='A').all()
+    total_spots = session.query(ParkingSpot).filter_by(lot_id=lot_id).count()
     return render_template('user/available_spots.html', lot=lot, spots=available_spots, total_spots=total_spots)
 
 @user_bp.route('/book', methods=['POST'])
@@ -169,8 +338,11 @@ def book_spot():
         rating = int(request.form.get('rating') or 0)
         feedback = request.form.get('feedback', '').strip()
 
-        spot = ParkingSpot.query.get_or_404(spot_id)
+        # Spot ids carry their shard, so the booking goes straight to the right database
+        spot = session_for_id(spot_id).get(ParkingSpot, spot_id) or abort(404)
         lot = spot.lot
+        if lot.deleted_at:
+            abort(404)
 
         # Parse datetime
         start_dt = datetime.fromisoformat(start_time)
@@ -198,17 +370,15 @@ def book_spot():
         )
 
         flash(
-            f"Spot #{reservation.spot_id} booked today "
+            f"Spot #{spot.number} booked today "
             f"from {start_dt.strftime('%H:%M')} to {end_dt.strftime('%H:%M')}! "
             f"Total: ₹{total_price}",
             "success"
         )
-        print(f"[BOOKING SUCCESS] User #{current_user.id} booked Spot #{spot.id} "
-              f"from {start_dt} to {end_dt}, Cost: ₹{total_price}")
-        
+
     except ValueError as e:
         flash(str(e), "danger")
-        print(f"[Error] {e}")
+        log_event('booking_rejected', user_id=current_user.id, reason=str(e))
         raise ValueError(f"Error committing reservation: {e}")
 
     return redirect(url_for('user.my_bookings'))
@@ -217,7 +387,6 @@ def book_spot():
 @login_required
 def my_bookings():
     now = datetime.now()
-    today = now.date()
 
     # Release expired spots first
     auto_release_expired_reservations()
@@ -225,46 +394,81 @@ def my_bookings():
     rating_booking_id = request.args.get("booking_id")
 
     # Active = reservations for today that are still valid
-    active = Reservation.query.filter(
-        Reservation.user_id == current_user.id,
-        Reservation.parking_timestamp >= datetime.combine(today, datetime.min.time()),
-        Reservation.leaving_timestamp >= now
-    ).order_by(Reservation.parking_timestamp.asc()).all()
+    active = get_active_booking_rows(current_user.id, now)
 
-    # Past = reservations already ended
-    past = Reservation.query.filter(
-        Reservation.user_id == current_user.id,
-        Reservation.leaving_timestamp < now
-    ).order_by(Reservation.leaving_timestamp.desc()).all()
-
-    # Attach location names
-    for booking in active + past:
-        booking.location = booking.lot.prime_location_name if booking.lot else 'Unknown Location'
+    # Past = completed or cancelled reservations, including archived history
+    past = get_past_booking_rows(current_user.id)
 
     return render_template(
     'user/my_bookings.html',
     active_bookings=active,
     past_bookings=past,
-    current_time=datetime.utcnow(),
+    waitlist=get_open_waitlist_rows(current_user.id),
+    current_time=now,
     show_rating_modal=show_rating_modal,
     rating_booking_id=rating_booking_id
 )
 
 
+@user_bp.route('/my_bookings/export')
+@login_required
+def export_bookings():
+    """Stream the user's full booking history, live and archived, as CSV."""
+    user_id = current_user.id
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['booking_id', 'spot_id', 'location', 'start', 'end', 'cost', 'rating', 'feedback'])
+        for booking in iter_booking_history_rows(user_id):
+            writer.writerow([
+                booking.id,
+                booking.spot_id,
+                booking.lot_name or 'Unknown Location',
+                booking.parking_timestamp.isoformat() if booking.parking_timestamp else '',
+                booking.leaving_timestamp.isoformat() if booking.leaving_timestamp else '',
+                booking.parking_cost or 0,
+                booking.rating or '',
+                booking.feedback or ''
+            ])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=booking_history.csv'}
+    )
+
+
 @user_bp.route('/checkout/<int:booking_id>', methods=['POST'])
 @login_required
 def checkout(booking_id):
-    booking = Reservation.query.get_or_404(booking_id)
+    session = session_for_id(booking_id)
+    booking = session.get(Reservation, booking_id) or abort(404)
 
-    # Validate booking belongs to user and not already checked out
-    if booking.user_id != current_user.id or booking.leaving_timestamp:
+    # Validate booking belongs to user and is under way
+    # Active, or booked and started but not yet promoted by the expiry sweep
+    now = datetime.now()
+    if booking.user_id != current_user.id or booking.status not in (BOOKED, ACTIVE) or booking.parking_timestamp > now:
         flash("Invalid or already checked out", "warning")
         return redirect(url_for('user.my_bookings'))
 
     # Mark booking as checked out
-    booking.leaving_timestamp = datetime.now()
-    booking.spot.status = 'A'
+    try:
+        close_reservation(booking, COMPLETED, now)
+    except ValueError:
+        rollback_shard(session)
+        flash("Invalid or already checked out", "warning")
+        return redirect(url_for('user.my_bookings'))
+    commit_shard(session)
+    record_booking_closed(booking.user_id)
+    cancel_reminders([booking.id])
+    queue_checkout_receipt(current_user, booking, booking.spot.lot.prime_location_name)
     db.session.commit()
+    log_event('checkout', booking_id=booking.id, spot_id=booking.spot_id, user_id=current_user.id)
+    serve_waitlist([booking.spot_id], now)
 
     flash("Checked out successfully!", "success")
 
@@ -275,30 +479,128 @@ def checkout(booking_id):
 @user_bp.route('/cancel/<int:booking_id>', methods=['POST'])
 @login_required
 def cancel_booking(booking_id):
+    session = session_for_id(booking_id)
     try:
-        booking = Reservation.query.get_or_404(booking_id)
+        booking = session.get(Reservation, booking_id) or abort(404)
 
         if booking.user_id != current_user.id:
             flash("Unauthorized action.", "danger")
             return redirect(url_for('user.my_bookings'))
 
         # Free the spot
-        booking.spot.status = 'A'
-        booking.leaving_timestamp = datetime.utcnow()
+        now = datetime.now()
+        close_reservation(booking, CANCELLED, now)
+        commit_shard(session)
+        record_booking_closed(booking.user_id)
+        cancel_reminders([booking.id])
 
         db.session.commit()
+        log_event('cancel', booking_id=booking.id, spot_id=booking.spot_id, user_id=current_user.id)
         flash(f"Booking #{booking.id} has been cancelled successfully!", "success")
+        serve_waitlist([booking.spot_id], now)
+
+    except ValueError as e:
+        rollback_shard(session)
+        db.session.rollback()
+        flash(str(e), "warning")
 
     except Exception as e:
+        rollback_shard(session)
         db.session.rollback()
-        print(f"[CANCEL ERROR] {e}")
+        log_event('cancel_error', booking_id=booking_id, error=str(e))
         flash("Error cancelling booking.", "danger")
 
     return redirect(url_for('user.my_bookings'))
 
 
+@user_bp.route('/waitlist', methods=['POST'])
+@login_required
+def join_lot_waitlist():
+    try:
+        lot = ParkingLot.query.get_or_404(int(request.form.get('lot_id') or 0))
+        if lot.deleted_at:
+            abort(404)
+        now = datetime.now()
+        start_dt = datetime.fromisoformat(request.form.get('start_time'))
+        end_dt = datetime.fromisoformat(request.form.get('end_time'))
+        if start_dt.date() != now.date() or end_dt.date() != now.date():
+            raise ValueError("You can only book for today.")
+        if end_dt <= start_dt:
+            raise ValueError("End time must be after start time.")
+        if end_dt <= now:
+            raise ValueError("That time window has already ended.")
+        # A window already under way is served from whenever a spot frees up
+        start_dt = max(start_dt, now)
+
+        free = [
+            number
+            for spot_rows in fan_out_lots(lambda session, lot_ids: _search_spots(session, lot_ids, [(start_dt, end_dt)]), [lot.id])
+            for _, number, _, available in spot_rows if available
+        ]
+        if free:
+            flash(f"Spot #{free[0]} is free for that window; book it directly.", "info")
+            return redirect(url_for('user.user_dashboard'))
+
+        join_waitlist(current_user.id, lot.id, start_dt, end_dt, auto_book=bool(request.form.get('auto_book')))
+        flash(f"You are on the waitlist for {lot.prime_location_name}.", "success")
+    except (TypeError, ValueError) as e:
+        flash(str(e) or "Invalid waitlist request.", "danger")
+        return redirect(url_for('user.user_dashboard'))
+
+    return redirect(url_for('user.my_bookings'))
+
+
+@user_bp.route('/waitlist/<int:entry_id>/accept', methods=['POST'])
+@login_required
+def accept_waitlist_offer(entry_id):
+    entry = db.session.get(WaitlistEntry, entry_id)
+    if entry is None or entry.user_id != current_user.id:
+        abort(404)
+    now = datetime.now()
+    if entry.status != 'offered' or entry.offer_expires_at <= now:
+        flash("This offer is no longer open.", "warning")
+        return redirect(url_for('user.my_bookings'))
+
+    spot = session_for_id(entry.spot_id).get(ParkingSpot, entry.spot_id)
+    try:
+        if spot is None or spot.lot.deleted_at:
+            raise ValueError("This spot is no longer available.")
+        reservation = book_waitlist_entry(entry, spot, now, from_status='offered')
+    except ValueError as e:
+        # Someone booked the spot directly in the meantime; keep the user's place
+        db.session.rollback()
+        return_to_queue(entry)
+        db.session.commit()
+        flash(f"{e} You are back on the waitlist.", "warning")
+        return redirect(url_for('user.my_bookings'))
+
+    if reservation is None:
+        flash("This offer is no longer open.", "warning")
+    else:
+        flash(f"Spot #{spot.number} booked from the waitlist! Total: ₹{reservation.parking_cost}", "success")
+    return redirect(url_for('user.my_bookings'))
+
+
+@user_bp.route('/waitlist/<int:entry_id>/leave', methods=['POST'])
+@login_required
+def leave_waitlist(entry_id):
+    entry = db.session.get(WaitlistEntry, entry_id)
+    if entry is None or entry.user_id != current_user.id:
+        abort(404)
+    was_offered = entry.status == 'offered'
+    if entry.status in ('waiting', 'offered') and claim_entry(entry, entry.status, 'left'):
+        db.session.commit()
+        log_event('waitlist_left', entry_id=entry.id, user_id=current_user.id)
+        if was_offered:
+            # A declined offer goes straight to the next in line
+            serve_waitlist([entry.spot_id], datetime.now())
+    flash("You have left the waitlist.", "success")
+    return redirect(url_for('user.my_bookings'))
+
+
 @user_bp.route('/search_parking_ajax', methods=['POST'])
 @login_required
+@rate_limited('SEARCH')
 def search_parking_ajax():
     query = request.form.get('query', '').strip()
     start_time = request.form.get('start_time')
@@ -306,53 +608,101 @@ def search_parking_ajax():
     results = []
 
     if query:
-        lots = ParkingLot.query.filter(
-            (ParkingLot.pin_code.like(f"%{query}%")) |
-            (ParkingLot.prime_location_name.ilike(f"%{query}%")) |
-            (ParkingLot.address.ilike(f"%{query}%"))
-        ).all()
-
-        for lot in lots:
-            available_spots = []
-            for s in lot.spots:
-                if not start_time or not end_time:
-                    if s.status == 'A':
-                        available_spots.append(s)
-                else:
-                    start_dt = datetime.fromisoformat(start_time)
-                    end_dt = datetime.fromisoformat(end_time)
-                    overlap = Reservation.query.filter(
-                        Reservation.spot_id == s.id,
-                        Reservation.parking_timestamp < end_dt,
-                        Reservation.leaving_timestamp > start_dt
-                    ).first()
-                    if not overlap:
-                        available_spots.append(s)
+        lots = search_lot_catalog(query)
+
+        windows = []
+        if start_time and end_time:
+            windows = [(datetime.fromisoformat(start_time), datetime.fromisoformat(end_time))]
+        rates = get_hourly_rates(lots)
+        prices = quote_prices(lots, windows)
+
+        # Each lot's spots, and any bookings overlapping the window, come from its own shard
+        spots_by_lot = {}
+        shard_rows = fan_out_lots(
+            lambda session, lot_ids: _search_spots(session, lot_ids, windows),
+            [lot.id for lot in lots]
+        )
+        for spot_rows in shard_rows:
+            for spot_id, number, lot_id, available in spot_rows:
+                spots_by_lot.setdefault(lot_id, []).append((spot_id, number, available))
+
+        for i, lot in enumerate(lots):
+            spots = spots_by_lot.get(lot.id, [])
+            available_spots = [(spot_id, number) for spot_id, number, available in spots if available]
             results.append({
                 'id': lot.id,
                 'prime_location_name': lot.prime_location_name,
                 'address': lot.address,
                 'pin_code': lot.pin_code,
-                'total_spots': len(lot.spots),
+                'total_spots': len(spots),
                 'available_spots': len(available_spots),
-                'rate': getattr(lot, 'price', 0),
-                'spots': [{'id': s.id, 'number': getattr(s, 'spot_number', s.id)} for s in available_spots]
+                'rate': float(rates[i]),
+                'price': float(prices[i, 0]) if windows else None,
+                'spots': [{'id': spot_id, 'number': number} for spot_id, number in available_spots]
             })
     return jsonify(results)
 
+def _search_spots(session, lot_ids, windows):
+    """(spot id, spot number, lot id, available) for the lots; with a window, free means no overlapping booking."""
+    spots = session.query(ParkingSpot.id, ParkingSpot.number, ParkingSpot.lot_id, ParkingSpot.status)\
+        .filter(ParkingSpot.lot_id.in_(lot_ids)).order_by(ParkingSpot.number).all()
+    if not windows:
+        return [(spot.id, spot.number, spot.lot_id, spot.status == 'A') for spot in spots]
+    start_dt, end_dt = windows[0]
+    booked = {
+        row.spot_id for row in session.query(Reservation.spot_id)
+        .join(ParkingSpot, ParkingSpot.id == Reservation.spot_id)
+        .filter(
+            ParkingSpot.lot_id.in_(lot_ids),
+            Reservation.live(),
+            Reservation.parking_timestamp < end_dt,
+            Reservation.leaving_timestamp > start_dt
+        )
+    }
+    return [(spot.id, spot.number, spot.lot_id, spot.id not in booked) for spot in spots]
+
+@user_bp.route('/quote', methods=['POST'])
+@login_required
+def quote():
+    """Price many lots over many windows: {"lot_ids": [...], "windows": [[start, end], ...]}."""
+    data = request.get_json(silent=True) or {}
+    try:
+        lot_ids = [int(lot_id) for lot_id in data.get('lot_ids', [])]
+        windows = [
+            (datetime.fromisoformat(start), datetime.fromisoformat(end))
+            for start, end in data.get('windows', [])
+        ]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid lot ids or time windows.'}), 400
+    if len(lot_ids) > current_app.config['QUOTE_MAX_LOTS'] or len(windows) > current_app.config['QUOTE_MAX_WINDOWS']:
+        return jsonify({'error': f"At most {current_app.config['QUOTE_MAX_LOTS']} lots and "
+                                 f"{current_app.config['QUOTE_MAX_WINDOWS']} windows per quote."}), 400
+    if any(end <= start for start, end in windows):
+        return jsonify({'error': 'Each window must end after it starts.'}), 400
+
+    lots = ParkingLot.query.filter(ParkingLot.id.in_(lot_ids), ParkingLot.deleted_at.is_(None))\
+        .order_by(ParkingLot.id).all()
+    prices = quote_prices(lots, windows)
+    return jsonify({
+        'lot_ids': [lot.id for lot in lots],
+        'rates': get_hourly_rates(lots).tolist(),
+        'prices': prices.tolist()
+    })
+
 @user_bp.route('/submit_rating', methods=['POST'])
 @login_required
 def submit_rating():
     booking_id = request.form.get('booking_id')
     rating = int(request.form.get('rating') or 0)
     feedback = request.form.get('feedback', '').strip()
-    booking = Reservation.query.get_or_404(booking_id)
+    session = session_for_id(booking_id)
+    booking = session.get(Reservation, booking_id) or abort(404)
     if booking.user_id != current_user.id:
         flash('Unauthorized', 'danger')
         return redirect(url_for('user.my_bookings'))
 
     booking.rating = rating
     booking.feedback = feedback
-    db.session.commit()
+    session.commit()
     flash('Thank you for your feedback!', 'success')
     return redirect(url_for('user.my_bookings'))
\ No newline at end of file
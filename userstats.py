@@ -0,0 +1,104 @@
+import click
+from sqlalchemy import func, update, case
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Reservation, ArchivedReservation, UserStats
+from sharding import fan_out
+
+
+def compute_user_stats(user_id):
+    """Recount a user's figures from reservation and archived_reservation in every shard."""
+    totals = fan_out(lambda session: _count_user_bookings(session, user_id))
+    return UserStats(
+        user_id=user_id,
+        total_bookings=sum(total for total, _, _, _ in totals),
+        active_bookings=sum(active for _, active, _, _ in totals),
+        total_spent=float(sum(spent for _, _, spent, _ in totals)),
+        last_booking_at=max(filter(None, (last for _, _, _, last in totals)), default=None)
+    )
+
+
+def _count_user_bookings(session, user_id):
+    live_total, live_active, live_spent, live_last = session.query(
+        func.count(Reservation.id),
+        func.coalesce(func.sum(case((Reservation.live(), 1), else_=0)), 0),
+        func.coalesce(func.sum(Reservation.parking_cost), 0),
+        func.max(Reservation.parking_timestamp)
+    ).filter(Reservation.user_id == user_id).one()
+    archived_total, archived_spent, archived_last = session.query(
+        func.count(ArchivedReservation.id),
+        func.coalesce(func.sum(ArchivedReservation.parking_cost), 0),
+        func.max(ArchivedReservation.parking_timestamp)
+    ).filter(ArchivedReservation.user_id == user_id).one()
+    return (
+        live_total + archived_total,
+        live_active,
+        live_spent + archived_spent,
+        max(filter(None, (live_last, archived_last)), default=None)
+    )
+
+
+def get_user_stats(user_id):
+    """The user's counter row; rebuilt from source the first time it is missing."""
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        stats = compute_user_stats(user_id)
+        db.session.add(stats)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request rebuilt the row first; theirs counts the same bookings
+            db.session.rollback()
+            stats = db.session.get(UserStats, user_id)
+    return stats
+
+
+def record_booking_created(user_id, cost, start_dt):
+    _apply(user_id, {
+        UserStats.total_bookings: UserStats.total_bookings + 1,
+        UserStats.active_bookings: UserStats.active_bookings + 1,
+        UserStats.total_spent: UserStats.total_spent + (cost or 0),
+        UserStats.last_booking_at: case(
+            (UserStats.last_booking_at.is_(None), start_dt),
+            (UserStats.last_booking_at < start_dt, start_dt),
+            else_=UserStats.last_booking_at
+        ),
+    })
+
+
+def record_booking_closed(user_id):
+    """A live booking reached a final status; close_reservation lets that happen only once."""
+    _apply(user_id, {
+        UserStats.active_bookings: UserStats.active_bookings - 1,
+    })
+
+
+def _apply(user_id, values):
+    """Update the counters in the caller's transaction; the caller commits.
+
+    A missing row is left alone: get_user_stats rebuilds it from the
+    committed bookings on the next read, in whichever shard they live.
+    """
+    db.session.execute(
+        update(UserStats).where(UserStats.user_id == user_id).values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_all_user_stats(batch_size=500):
+    """Recompute every user's counters from the reservation tables."""
+    rebuilt = 0
+    user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+    for start in range(0, len(user_ids), batch_size):
+        for user_id in user_ids[start:start + batch_size]:
+            db.session.merge(compute_user_stats(user_id))
+            rebuilt += 1
+        db.session.commit()
+    return rebuilt
+
+
+def init_user_stats(app):
+    @app.cli.command('rebuild-user-stats')
+    def rebuild_user_stats_command():
+        """Recompute per-user booking counters from the reservation tables."""
+        rebuilt = rebuild_all_user_stats()
+        click.echo(f"Rebuilt booking stats for {rebuilt} users")
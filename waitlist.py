@@ -0,0 +1,219 @@
+import random
+import statistics
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import create_engine, update, func
+from sqlalchemy.orm import Session
+from models import db, User, ParkingLot, ParkingSpot, WaitlistEntry
+from sharding import session_for_id
+from notifications import enqueue_email
+from events import log_event
+
+POLICIES = ('fifo', 'best_fit')
+OPEN_STATUSES = ('waiting', 'offered')
+
+WaitlistRow = namedtuple('WaitlistRow', [
+    'id', 'lot_id', 'lot_name', 'window_start', 'window_end', 'auto_book',
+    'status', 'spot_id', 'spot_number', 'offer_expires_at', 'position',
+])
+
+
+# ----------------------------
+# Queue
+# ----------------------------
+def join_waitlist(user_id, lot_id, window_start, window_end, auto_book=False):
+    """Queue the user for a lot; the caller has checked the lot is full for the window."""
+    already = db.session.query(WaitlistEntry.id).filter(
+        WaitlistEntry.user_id == user_id,
+        WaitlistEntry.lot_id == lot_id,
+        WaitlistEntry.status.in_(OPEN_STATUSES)
+    ).first()
+    if already:
+        raise ValueError("You are already on the waitlist for this lot.")
+
+    entry = WaitlistEntry(user_id=user_id, lot_id=lot_id, window_start=window_start,
+                          window_end=window_end, auto_book=auto_book)
+    db.session.add(entry)
+    db.session.commit()
+    log_event('waitlist_joined', entry_id=entry.id, lot_id=lot_id, user_id=user_id,
+              start=window_start, end=window_end, auto_book=auto_book)
+    return entry
+
+
+def get_open_waitlist_rows(user_id):
+    """The user's waiting and offered entries, with their place in each lot's queue."""
+    rows = db.session.query(WaitlistEntry, ParkingLot.prime_location_name)\
+        .join(ParkingLot, ParkingLot.id == WaitlistEntry.lot_id)\
+        .filter(WaitlistEntry.user_id == user_id, WaitlistEntry.status.in_(OPEN_STATUSES))\
+        .order_by(WaitlistEntry.id).all()
+    return [
+        WaitlistRow(entry.id, entry.lot_id, lot_name, entry.window_start, entry.window_end, entry.auto_book,
+                    entry.status, entry.spot_id, _spot_number(entry.spot_id), entry.offer_expires_at,
+                    queue_position(entry) if entry.status == 'waiting' else None)
+        for entry, lot_name in rows
+    ]
+
+
+def _spot_number(spot_id):
+    if spot_id is None:
+        return None
+    spot = session_for_id(spot_id).get(ParkingSpot, spot_id)
+    return spot.number if spot else None
+
+
+def queue_position(entry):
+    """1 for the head of the lot's first-come queue."""
+    return db.session.query(func.count(WaitlistEntry.id)).filter(
+        WaitlistEntry.lot_id == entry.lot_id,
+        WaitlistEntry.with_status('waiting'),
+        WaitlistEntry.id < entry.id
+    ).scalar() + 1
+
+
+def next_waitlist_entry(lot_id, free_from, free_until=None, policy='fifo', session=None):
+    """Head of the lot's queue among entries that fit the free gap [free_from, free_until).
+
+    Both policies read one lot's range of the partial (lot_id, window_end)
+    index over waiting rows: best-fit seeks the latest end that still fits,
+    first-come takes the oldest entry in the range. Other lots' queues and
+    entries already served are never touched.
+    """
+    query = (session or db.session).query(WaitlistEntry).filter(
+        WaitlistEntry.lot_id == lot_id,
+        WaitlistEntry.with_status('waiting'),
+        WaitlistEntry.window_end > free_from
+    )
+    if free_until is not None:
+        query = query.filter(WaitlistEntry.window_end <= free_until)
+    if policy == 'best_fit':
+        # Least idle time left before the spot's next booking
+        query = query.order_by(WaitlistEntry.window_end.desc(), WaitlistEntry.id)
+    else:
+        query = query.order_by(WaitlistEntry.id)
+    return query.first()
+
+
+def claim_entry(entry, from_status, to_status, session=None, **values):
+    """Move an entry on unless another request already did; the caller commits.
+
+    Two spots freed at once may pick the same head entry; the conditional
+    UPDATE lets exactly one of them have it.
+    """
+    result = (session or db.session).execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.id == entry.id, WaitlistEntry.status == from_status)
+        .values(status=to_status, **values)
+    )
+    return result.rowcount == 1
+
+
+def offer_spot(entry, spot, lot_name, start, expires_at):
+    """Offer a freed spot to a waiting entry. False if it was served elsewhere first."""
+    if not claim_entry(entry, 'waiting', 'offered', spot_id=spot.id, offer_expires_at=expires_at):
+        db.session.rollback()
+        return False
+    user = db.session.get(User, entry.user_id)
+    if user.email:
+        enqueue_email('waitlist_offer', user.email, username=user.username, lot_name=lot_name,
+                      spot_number=spot.number, start=start, end=entry.window_end, expires=expires_at)
+    db.session.commit()
+    log_event('waitlist_offered', entry_id=entry.id, spot_id=spot.id, user_id=entry.user_id)
+    return True
+
+
+def return_to_queue(entry):
+    """Put an offered entry back in line, keeping its place; the caller commits."""
+    claim_entry(entry, 'offered', 'waiting', spot_id=None, offer_expires_at=None)
+
+
+def expire_waitlist(now):
+    """Close entries whose window has passed and offers left untaken; the caller commits.
+
+    Returns the spot ids of the lapsed offers, which are free for the next in line.
+    """
+    lapsed = db.session.query(WaitlistEntry.id, WaitlistEntry.spot_id).filter(
+        WaitlistEntry.with_status('offered'),
+        WaitlistEntry.offer_expires_at <= now
+    ).all()
+    if lapsed:
+        db.session.execute(
+            update(WaitlistEntry)
+            .where(WaitlistEntry.id.in_([row.id for row in lapsed]), WaitlistEntry.status == 'offered')
+            .values(status='expired')
+            .execution_options(synchronize_session=False)
+        )
+    db.session.execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.with_status('waiting'), WaitlistEntry.window_end <= now)
+        .values(status='expired')
+        .execution_options(synchronize_session=False)
+    )
+    return [row.spot_id for row in lapsed]
+
+
+# ----------------------------
+# Matching benchmark
+# ----------------------------
+def simulate_matching(entries, depth, events, policy, seed=0):
+    """Time next_waitlist_entry plus its claim against a throwaway SQLite queue.
+
+    `entries` waiting rows with random windows today are spread `depth` to a
+    lot, next to as many rows already served; each of `events` freed spots
+    matches a random lot's queue against a random gap. Returns per-match
+    latencies in microseconds.
+    """
+    rng = random.Random(seed)
+    lots = max(1, entries // depth)
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[User.__table__, ParkingLot.__table__, WaitlistEntry.__table__])
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    with Session(engine) as session:
+        session.execute(User.__table__.insert(), [{'id': 1, 'username': 'sim', 'password': 'x', 'role': 'user'}])
+        session.execute(ParkingLot.__table__.insert(), [
+            {'id': lot_id, 'prime_location_name': f'Lot {lot_id}', 'price': 50, 'address': '-',
+             'pin_code': '000000', 'maximum_number_of_spots': 10}
+            for lot_id in range(1, lots + 1)
+        ])
+        rows = []
+        for i in range(2 * entries):
+            start = day + timedelta(minutes=rng.randrange(0, 20 * 60))
+            rows.append({'user_id': 1, 'lot_id': rng.randint(1, lots), 'window_start': start,
+                         'window_end': start + timedelta(minutes=rng.randrange(30, 4 * 60)),
+                         'auto_book': False, 'status': 'waiting' if i % 2 else 'booked'})
+        session.execute(WaitlistEntry.__table__.insert(), rows)
+        session.commit()
+
+        timings = []
+        for _ in range(events):
+            lot_id = rng.randint(1, lots)
+            free_from = day + timedelta(minutes=rng.randrange(0, 20 * 60))
+            free_until = rng.choice((None, free_from + timedelta(minutes=rng.randrange(60, 6 * 60))))
+            started = time.perf_counter()
+            entry = next_waitlist_entry(lot_id, free_from, free_until, policy, session=session)
+            if entry is not None:
+                claim_entry(entry, 'waiting', 'offered', session=session)
+                session.commit()
+            timings.append((time.perf_counter() - started) * 1e6)
+    engine.dispose()
+    return timings
+
+
+def init_waitlist(app):
+    @app.cli.command('waitlist-bench')
+    @click.option('--entries', default='1000,10000,100000', help='Comma-separated waitlist sizes to simulate.')
+    @click.option('--depth', type=int, default=50, help='Waiting entries per lot.')
+    @click.option('--events', type=int, default=2000, help='Freed spots matched per run.')
+    @click.option('--policy', type=click.Choice(POLICIES), default=None, help='Defaults to WAITLIST_POLICY.')
+    def waitlist_bench_command(entries, depth, events, policy):
+        """Simulate freed spots against waitlists of growing size and report match latency."""
+        policy = policy or app.config['WAITLIST_POLICY']
+        click.echo(f"policy={policy} depth={depth} events={events}")
+        click.echo(f"{'entries':>10} {'lots':>8} {'mean us':>10} {'p95 us':>10}")
+        for size in (int(value) for value in entries.split(',') if value.strip()):
+            timings = simulate_matching(size, depth, events, policy)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            click.echo(f"{size:>10} {max(1, size // depth):>8} {statistics.mean(timings):>10.1f} {p95:>10.1f}")